@@ -0,0 +1,39 @@
+"""Add recommendation candidate table
+
+Revision ID: 9b2f6c1d7e4a
+Revises: 4c1495b93c8a
+Create Date: 2026-10-17 10:12:31.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2f6c1d7e4a'
+down_revision = '4c1495b93c8a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('recommendation_candidates',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('meal_time', sa.String(), nullable=False),
+    sa.Column('menu_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('create_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['menu_id'], ['menus.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_recommendation_candidates_id'), 'recommendation_candidates', ['id'], unique=False)
+    op.create_index('ix_recommendation_candidates_user_id_meal_time', 'recommendation_candidates', ['user_id', 'meal_time'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recommendation_candidates_user_id_meal_time', table_name='recommendation_candidates')
+    op.drop_index(op.f('ix_recommendation_candidates_id'), table_name='recommendation_candidates')
+    op.drop_table('recommendation_candidates')
@@ -14,6 +14,7 @@ from routers.menu import menu
 from routers.order import order
 from routers.feature import feature
 from routers.user_feature import user_feature
+from routers.recommendation import recommendation
 
 # Initiate Fast App
 app = FastAPI()
@@ -38,6 +39,44 @@ app.include_router(menu.router)
 app.include_router(order.router)
 app.include_router(feature.router)
 app.include_router(user_feature.router)
+app.include_router(recommendation.router)
+
+# Map the recommendation model once per worker and watch for newly published artifacts
+@app.on_event("startup")
+def load_recommendation_model():
+    # Without a model the bot recommends from the candidates or at random, and the watcher loads the model once it is published
+    try:
+        bot.food_recommendation.ensure_model_artifact()
+        bot.food_recommendation.model_holder.load()
+    except Exception as e:
+        print(f'Could not load the recommendation model at startup: {e}')
+    bot.food_recommendation.model_holder.start_watching()
+
+# Build the cold-start prior once per worker, so the first new user does not wait for the clustering
+@app.on_event("startup")
+def load_cold_start_prior():
+    # Without a prior the first new-user request builds it, and new users get other recommendations if that fails too
+    try:
+        bot.food_recommendation.load_cold_start_prior()
+    except Exception as e:
+        print(f'Could not build the cold-start prior at startup: {e}')
+
+# Create and warm up the food recognition sessions once per worker
+@app.on_event("startup")
+def load_food_recognition_models():
+    # Sessions that could not be created are created on the first recognition instead
+    try:
+        bot.food_recognition.load()
+    except Exception as e:
+        print(f'Could not load the food recognition models at startup: {e}')
+
+@app.on_event("shutdown")
+def stop_recommendation_model_watcher():
+    bot.food_recommendation.model_holder.stop_watching()
+
+@app.on_event("shutdown")
+def stop_food_recognition_batching():
+    bot.food_recognition.stop()
 
 @app.get('/')
 async def root():
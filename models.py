@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Float, DateTime
+from sqlalchemy import Column, ForeignKey, Integer, String, Float, DateTime, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -105,4 +105,16 @@ class UserState(Base):
     update_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now()) 
     create_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    user = relationship("User", back_populates="state")
\ No newline at end of file
+    user = relationship("User", back_populates="state")
+
+class RecommendationCandidate(Base):
+    __tablename__ = "recommendation_candidates"
+    __table_args__ = (Index("ix_recommendation_candidates_user_id_meal_time", "user_id", "meal_time"),)
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    meal_time = Column(String, nullable=False)
+    menu_id = Column(Integer, ForeignKey("menus.id"), nullable=False)
+    rank = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    create_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
@@ -1,17 +1,14 @@
 # Import general libraries
-import io
 import os
 import string
 from pathlib import Path
 from dotenv import load_dotenv, find_dotenv
 from datetime import datetime
-from scipy.sparse import csr_matrix, hstack
-from sklearn.preprocessing import MinMaxScaler
-import pandas as pd
 
 # Import FastAPI
 from fastapi import APIRouter, Depends, HTTPException, Request, Header
 from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
 
 # Import LINE Messaging API SDK
 from linebot import *
@@ -51,8 +48,21 @@ food_recommendation = FoodRecommendation()
 food_recognition = FoodRecognition()
 firebase_storage = FirebaseStorage()
 
-# Initialize database session
-db = database.SessionLocal()
+
+def with_db_session(handle_event):
+    """Give an event handler its own database session, as events are handled concurrently in the thread pool.
+
+    The wrapper takes only the event, so the webhook handler calls it like any other event handler.
+    """
+
+    def handle_event_with_db_session(event):
+        db = database.SessionLocal()
+        try:
+            return handle_event(event, db)
+        finally:
+            db.close()
+
+    return handle_event_with_db_session
 
 
 # TODO: (OPTIONAL) Add a store number to the menu table
@@ -197,9 +207,13 @@ def create_recognition_bubble(menu: any) -> dict:
     
     return recognition_bubble
 
-def create_daily_summary_bubble(daily_summary: dict) -> dict:
+def create_daily_summary_bubble(db, daily_summary: dict) -> dict:
     """Create a bubble message of the daily summary.
 
+    Args:
+        db (Session): Database session of the event.
+        daily_summary (dict): Daily summary of the user.
+
     Returns:
         daily_summary_bubble (dict): Bubble message of the daily summary.
     """
@@ -431,10 +445,9 @@ def get_flex_image_url(menu_id: int) -> str:
     flex_image_url = f"https://OUR-AZURE-DOMAIN/assets/images/flex_images/{menu_id}.jpg" #TODO: Change the domain 
     return flex_image_url
 
-def handle_unregistered_user_event(event: any):
+def handle_unregistered_user_event(event: any, db):
 
-    # Get database connection from global variable
-    global db
+    # Get LINE bot API from global variable
     global line_bot_api
 
     # Get user state by LINE ID
@@ -463,6 +476,66 @@ def get_meal():
     elif current_hour >= 17 or current_hour < 3:
         return 'Dinner'
 
+def recommend_menus_on_cache_miss(db, user_id: int, nutritional_goal_left: dict, meal_time: str, previous_menu_id: int = None) -> list:
+    """Recommend menus to a user whose recommendations are not cached.
+
+    Args:
+        db (Session): Database session of the event.
+        user_id (int): User ID.
+        nutritional_goal_left (dict): Nutrition left to reach the daily goal.
+        meal_time (str): Meal time, i.e. "Breakfast", "Lunch" or "Dinner".
+        previous_menu_id (int): Menu ID of the last order of the user, or None if the user has no orders.
+
+    Returns:
+        recommended_menus (list): Recommended menus, or an empty list if none could be recommended.
+    """
+
+    recommended_menus = None
+    if previous_menu_id is None:
+        # Users without orders get menus from the cold-start prior of their feature cluster
+        try:
+            recommended_menus = food_recommendation.recommend_menus_for_new_user(
+                db=db,
+                user_id=user_id,
+                nutritional_goal_left=nutritional_goal_left,
+                meal_time=meal_time
+            )
+        except Exception as e:
+            print(f'Could not recommend menus from the cold-start prior: {e}')
+    if recommended_menus:
+        return recommended_menus
+
+    # Get a list of recommended menus from the precomputed candidates of the user and meal time
+    try:
+        recommended_menus = food_recommendation.recommend_menus_from_candidates(
+            db=db,
+            user_id=user_id,
+            nutritional_goal_left=nutritional_goal_left,
+            meal_time=meal_time,
+            previous_menu_id=previous_menu_id
+        )
+    except Exception as e:
+        # Roll back a failed query, so the session can still be used by the model
+        db.rollback()
+        recommended_menus = None
+        print(f'Could not recommend menus from the precomputed candidates: {e}')
+
+    # Otherwise from the current model
+    model = food_recommendation.model_holder.get()
+    if not recommended_menus and model is not None:
+        try:
+            recommended_menus = food_recommendation.recommend_menus_for_user(
+                db=db,
+                model=model,
+                user_id=user_id,
+                nutritional_goal_left=nutritional_goal_left,
+                meal_time=meal_time,
+                previous_menu_id=previous_menu_id
+            )
+        except Exception as e:
+            print(f'Could not recommend menus with the model: {e}')
+    return recommended_menus or []
+
 
 @router.get("/")
 async def root():
@@ -478,11 +551,24 @@ async def get_flex_image(image_name: str):
         response = {"error": "Image not found"}
     return response
 
+@router.get("/recommendation_cache")
+async def get_recommendation_cache_stats():
+    return food_recommendation.recommendation_cache.stats()
+
+@router.get("/recognition_cache")
+async def get_recognition_cache_stats():
+    return food_recognition.recognition_cache.stats()
+
+@router.get("/recognition_batching")
+async def get_recognition_batching_stats():
+    return food_recognition.batching_stats()
+
 @router.post("/callback")
 async def callback(request: Request, x_line_signature=Header(None)):
     body = await request.body()
     try:
-        handler.handle(body.decode("utf-8"), x_line_signature)
+        # Handle events in the thread pool, so concurrent photos can share inference batches
+        await run_in_threadpool(handler.handle, body.decode("utf-8"), x_line_signature)
     
     except InvalidSignatureError:
         raise HTTPException(status_code=400, detail="InvalidSignatureError")
@@ -510,7 +596,8 @@ async def recognition_feedback(request: Request):
 
 
 @handler.add(MessageEvent, message=TextMessage)
-def text_message(event):
+@with_db_session
+def text_message(event, db):
     """Handle text messages, including requests for food recommendations sent by users.
 
     Args:
@@ -518,7 +605,7 @@ def text_message(event):
     """
 
     # Handle unregistered user event, get user state, and return if user does not exist
-    user_state = handle_unregistered_user_event(event=event)
+    user_state = handle_unregistered_user_event(event=event, db=db)
     if not user_state:
         return
 
@@ -527,86 +614,58 @@ def text_message(event):
         # If user state is "start", the user has not requested for food recommendations yet.
         if user_state.state == "registered":
 
-            gender_mapping = {
-                "Male": (0, 1),
-                "Female": (1, 0)
-            }
-
-            sc = MinMaxScaler()
-
-            # User features
-            users = user_crud.get_users(db=db)
-            user_age_height_weight_norm = list(map(tuple, sc.fit_transform([[2023 - user.birth_date.year, user.height, user.weight] for user in users])))
-
-            user_preferences = user_feature_crud.get_user_features_flag(db=db)
-            user_predference_features = [(x.cheap, x.chicken, x.fried, x.pork, x.salty, x.soup, x.spicy, x.steam, x.sweet, x.vegetable) for x in user_preferences]
-
-            user_features_sparse = csr_matrix([numerical + (gender_mapping[user.gender]) + prefer for numerical, prefer, user in zip(user_age_height_weight_norm, user_predference_features, users)])
-
-            # Food features
-            menu_features = menu_crud.get_menu_features(db=db)
-            menu_features_sparse = csr_matrix([(menu.spicy, menu.high_sugar, menu.high_fat, menu.high_calorie, menu.is_light, menu.is_fried, menu.contain_water, menu.has_vegetable, menu.high_sodium, menu.high_protein, menu.high_carbohydrate, menu.high_cholesterol, menu.has_chicken, menu.has_pork, menu.has_noodle, menu.high_price) for menu in menu_features])
-
-            # Interaction Matrix
-            interaction_matrix = order_crud.get_orders(db=db)
-
-            interaction_user = [order.user_id for order in interaction_matrix]
-            fill_in_user = [user_id for user_id in range(0, len(users)) if user_id not in interaction_user]
-            interaction_user = interaction_user + fill_in_user
-
-            interaction_menu = [order.menu_id for order in interaction_matrix] + ([0.0] * len(fill_in_user))
-
-            interaction_rating = [order.rating for order in interaction_matrix] + ([0.0] * len(fill_in_user))
-
-            interaction_matrix_sparse = pd.crosstab(interaction_user, interaction_menu, values=interaction_rating, aggfunc='mean').fillna(0)
-
-            # Get food nutrition data
-            nutritional_data = menu_crud.get_menus_for_recommendation(db=db)
-
             # Nutritional goal left
             line_user_id = event.source.user_id
-            user_id = [user.id for user in users if user.line_id == line_user_id][0]
-
-            # Retrieve summarized nutrition values from the database
-            query_result = order_crud.get_daily_summary(db=db, user_id=user_id)
-
-            # Check if there is any order history since start of day
-            if len(query_result) == 0:
-                daily_summary = {
-                    "Protein": 0.0,
-                    "Carbs": 0.0,
-                    "Fat": 0.0,
-                    "Calories": 0.0
-                }
-            else:
-                # Store result in dictionary
-                daily_summary = {
-                    "Protein": query_result[0][1],
-                    "Carbs": query_result[0][2],
-                    "Fat": query_result[0][3],
-                    "Calories": query_result[0][4]
-                }
-
-            nutritional_goal_left = {
-                "Protein": 50 - daily_summary["Protein"],
-                "Carbs": 300 - daily_summary["Carbs"],
-                "Fat": 70 - daily_summary["Fat"],
-                "Calories": 2000 - daily_summary["Calories"]
-            }
-
-            # Previous food 
-            previous_food = order_crud.get_lastest_order(db=db, user_id=user_id)
+            user_id = user_crud.get_user_by_line_id(db=db, line_id=line_user_id).id
 
             # Meal time
             meal_time = get_meal()
 
-            print(interaction_matrix_sparse)
+            # Answer repeated requests from the recommendation cache before the summary queries. The daily summary
+            # and the previous food only change with the day and the user's orders, so the key is the date and the
+            # ID of the user's last order, which also changes with orders created by other workers.
+            last_order_id = order_crud.get_last_order_id_of_user(db=db, user_id=user_id)
+            cache_key = (user_id, meal_time, (datetime.now().date(), last_order_id))
+            recommended_menus = food_recommendation.recommendation_cache.get(cache_key)
+            if recommended_menus is None:
+
+                # Retrieve summarized nutrition values from the database
+                query_result = order_crud.get_daily_summary(db=db, user_id=user_id)
+
+                # Check if there is any order history since start of day
+                if len(query_result) == 0:
+                    daily_summary = {
+                        "Protein": 0.0,
+                        "Carbs": 0.0,
+                        "Fat": 0.0,
+                        "Calories": 0.0
+                    }
+                else:
+                    # Store result in dictionary
+                    daily_summary = {
+                        "Protein": query_result[0][1],
+                        "Carbs": query_result[0][2],
+                        "Fat": query_result[0][3],
+                        "Calories": query_result[0][4]
+                    }
 
+                nutritional_goal_left = {
+                    "Protein": 50 - daily_summary["Protein"],
+                    "Carbs": 300 - daily_summary["Carbs"],
+                    "Fat": 70 - daily_summary["Fat"],
+                    "Calories": 2000 - daily_summary["Calories"]
+                }
 
-            # Get a list of recommended menus
-            recommended_menus = food_recommendation.recommend_menus()
-            # print(food_recommendation.get_food_features())
-            
+                # Previous food
+                previous_food = order_crud.get_lastest_order(db=db, user_id=user_id)
+                previous_menu_id = previous_food.menu_id if previous_food else None
+
+                recommended_menus = recommend_menus_on_cache_miss(db, user_id, nutritional_goal_left, meal_time, previous_menu_id)
+                if recommended_menus:
+                    food_recommendation.recommendation_cache.put(cache_key, recommended_menus)
+                else:
+                    recommended_menus = food_recommendation.recommend_menus(db=db)
+                
             # Create a carousel message of recommended menus
             menu_carousel = create_menu_carousel(menus=recommended_menus)
 
@@ -666,7 +725,7 @@ def text_message(event):
             }
     
         # Create a bubble message of the daily summary
-        daily_summary_bubble = create_daily_summary_bubble(daily_summary=daily_summary)
+        daily_summary_bubble = create_daily_summary_bubble(db=db, daily_summary=daily_summary)
         flex_message = FlexSendMessage(
             alt_text='Check out your today nutrition summary!',
             contents=daily_summary_bubble
@@ -690,7 +749,8 @@ def text_message(event):
         
 
 @handler.add(MessageEvent, message=ImageMessage)
-def image_message(event):
+@with_db_session
+def image_message(event, db):
     """Handle image messages by recognizing the menu of the food in the image.
 
     Args:
@@ -698,7 +758,7 @@ def image_message(event):
     """
 
     # Handle unregistered user event, get user state, and return if user does not exist
-    user_state = handle_unregistered_user_event(event=event)
+    user_state = handle_unregistered_user_event(event=event, db=db)
     if not user_state:
         return
     
@@ -716,14 +776,13 @@ def image_message(event):
         #     for chunk in message_content.iter_content():
         #         fd.write(chunk)
 
-        # Save image as a byte array
-        img_byte = io.BytesIO(message_content.content)
+        # Decode and resize the image once for both models
+        prepared_image = food_recognition.prepare_image(message_content.content)
 
-        # Check if the image contains food
-        is_food = food_recognition.is_food(img_byte)
-        if is_food:
-            # Recognize the menu
-            predicted_menu_id = food_recognition.recognize_menu(img_byte)
+        # Check if the image contains food and recognize the menu
+        recognition = food_recognition.recognize(prepared_image)
+        if recognition["is_food"]:
+            predicted_menu_id = recognition["menu_id"]
             predicted_menu = menu_crud.get_menu(db=db, menu_id=predicted_menu_id)
             
             # TODO:
@@ -0,0 +1,100 @@
+# Import general libraries
+import threading
+import numpy as np
+
+# Import recommendation
+from routers.line_bot.feature_matrix import MENU_FEATURES
+
+
+# Dietary constraints of a request as the menu feature flag and the value an eligible menu must have
+DIETARY_CONSTRAINTS = {
+    "no_pork": ("has_pork", 0),
+    "no_chicken": ("has_chicken", 0),
+    "no_noodle": ("has_noodle", 0),
+    "not_fried": ("is_fried", 0),
+    "not_spicy": ("spicy", 0),
+    "low_sugar": ("high_sugar", 0),
+    "low_fat": ("high_fat", 0),
+    "low_calorie": ("high_calorie", 0),
+    "low_sodium": ("high_sodium", 0),
+    "low_cholesterol": ("high_cholesterol", 0),
+    "low_price": ("high_price", 0),
+    "light": ("is_light", 1),
+    "with_vegetable": ("has_vegetable", 1)
+}
+
+
+class CandidateIndex:
+    """Menu feature flags packed into one bitmask per menu, used to filter menus by dietary constraints.
+
+    A set of constraints becomes one mask of flags that must be set and one mask of flags that must
+    be clear, so filtering is two bitwise operations over an array of M integers. The eligible rows
+    are then the only menus scored by the model.
+    """
+
+    def __init__(self, item_features, max_cached_masks: int = 256):
+        """Initialize the candidate index.
+
+        Args:
+            item_features (csr_matrix): Menu feature matrix with the MENU_FEATURES columns.
+            max_cached_masks (int): Number of constraint sets whose eligible rows are cached.
+        """
+
+        self.item_features = item_features
+
+        # Bit j of the bitmask of a menu is MENU_FEATURES[j]
+        flags = np.asarray(item_features.todense() if hasattr(item_features, "todense") else item_features) > 0
+        weights = np.left_shift(np.uint32(1), np.arange(len(MENU_FEATURES), dtype=np.uint32))
+        self.bitmasks = (flags.astype(np.uint32) * weights).sum(axis=1, dtype=np.uint32)
+        self.bitmasks.setflags(write=False)
+
+        self.max_cached_masks = max_cached_masks
+        self._lock = threading.Lock()
+        self._eligible_rows = {}
+
+    def __len__(self):
+        return len(self.bitmasks)
+
+    def is_built_for(self, item_features) -> bool:
+        return self.item_features is item_features
+
+    @staticmethod
+    def validate(constraints) -> list:
+        """Get the constraints that are not in DIETARY_CONSTRAINTS."""
+        return [constraint for constraint in constraints or () if constraint not in DIETARY_CONSTRAINTS]
+
+    @staticmethod
+    def constraint_masks(constraints) -> tuple:
+        """Get the bitmasks of the flags that must be set and of the flags that must be clear."""
+
+        set_mask, clear_mask = 0, 0
+        for constraint in constraints:
+            feature, value = DIETARY_CONSTRAINTS[constraint]
+            if value:
+                set_mask |= 1 << MENU_FEATURES.index(feature)
+            else:
+                clear_mask |= 1 << MENU_FEATURES.index(feature)
+        return np.uint32(set_mask), np.uint32(clear_mask)
+
+    def mask(self, constraints) -> np.ndarray:
+        """Get the boolean mask of the menus that satisfy all constraints."""
+
+        set_mask, clear_mask = self.constraint_masks(constraints)
+        return ((self.bitmasks & set_mask) == set_mask) & ((self.bitmasks & clear_mask) == 0)
+
+    def eligible_rows(self, constraints) -> np.ndarray:
+        """Get the rows of the menus that satisfy all constraints, or None if there are no constraints."""
+
+        if not constraints:
+            return None
+
+        key = frozenset(constraints)
+        eligible_rows = self._eligible_rows.get(key)
+        if eligible_rows is None:
+            eligible_rows = np.flatnonzero(self.mask(key))
+            eligible_rows.setflags(write=False)
+            with self._lock:
+                if len(self._eligible_rows) >= self.max_cached_masks:
+                    self._eligible_rows.pop(next(iter(self._eligible_rows)))
+                self._eligible_rows[key] = eligible_rows
+        return eligible_rows
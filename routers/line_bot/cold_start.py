@@ -0,0 +1,141 @@
+# Import general libraries
+import time
+import threading
+import numpy as np
+
+# Import libraries for recommendation
+from sklearn.cluster import KMeans
+from scipy.sparse import csr_matrix
+
+# Import database
+import database
+from routers.line_bot.menu_catalog import MEAL_TIMES
+from routers.line_bot.interaction_matrix import build_interaction_matrix
+
+
+class ColdStartPrior:
+    """Popularity x meal-time prior of the menus per cluster of user features, for users without orders.
+
+    Users are clustered by their feature rows, i.e. scaled demographics, gender and food preferences.
+    The prior of a cluster is the rating-weighted popularity of each menu among the users of the
+    cluster, smoothed towards the overall popularity, times the meal-time score of the menu. A new
+    user is assigned to the nearest cluster center, so serving is one distance computation and one
+    row lookup. The prior is built at startup with load() and rebuilt in the background when it expires or
+    the menus change, while the previous prior keeps being served.
+    """
+
+    def __init__(self, n_clusters: int = 8, prior_strength: float = 10.0, ttl: float = 3600.0):
+        """Initialize the cold-start prior.
+
+        Args:
+            n_clusters (int): Number of user feature clusters.
+            prior_strength (float): Weight of the overall popularity in the popularity of a cluster, in ratings.
+            ttl (float): Number of seconds after which the prior is rebuilt from the latest orders.
+        """
+
+        self.n_clusters = n_clusters
+        self.prior_strength = prior_strength
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._state = None
+        self._rebuilding = False
+
+    def invalidate(self, **kwargs):
+        """Expire the prior, so the next request rebuilds it in the background. Connected to the menu change signal."""
+
+        state = self._state
+        if state is not None:
+            state["expires_at"] = 0.0
+
+    def build(self, db, feature_matrix, nutrient_table) -> dict:
+        """Cluster the users and compute the prior of every cluster, meal time and menu."""
+
+        user_features = np.asarray(feature_matrix.get_user_features().todense(), dtype=np.float64)
+        menu_ids = np.asarray(feature_matrix.menu_ids, dtype=np.int64)
+
+        # Cluster the user feature rows, or use one cluster if there are too few users
+        n_clusters = max(1, min(self.n_clusters, len(user_features)))
+        if len(user_features) > n_clusters:
+            kmeans = KMeans(n_clusters=n_clusters, n_init=10, random_state=0).fit(user_features)
+            centers, labels = kmeans.cluster_centers_, kmeans.labels_
+        else:
+            centers = user_features if len(user_features) else np.zeros((1, user_features.shape[1]))
+            labels = np.arange(len(user_features))
+
+        # Rating-weighted popularity of each menu per cluster, where unrated orders count as 1
+        interactions = build_interaction_matrix(db, user_ids=feature_matrix.user_ids, menu_ids=menu_ids, missing_rating=1.0).matrix.tocsr()
+        membership = csr_matrix((np.ones(len(labels)), (labels, np.arange(len(labels)))), shape=(len(centers), len(labels)))
+        cluster_ratings = np.asarray((membership @ interactions).todense(), dtype=np.float64)
+
+        overall_ratings = cluster_ratings.sum(axis=0)
+        overall_share = overall_ratings / overall_ratings.sum() if overall_ratings.sum() > 0 else np.full(len(menu_ids), 1.0 / max(len(menu_ids), 1))
+        popularity = (cluster_ratings + self.prior_strength * overall_share) / (cluster_ratings.sum(axis=1, keepdims=True) + self.prior_strength)
+        max_popularity = popularity.max(axis=1, keepdims=True) if len(menu_ids) else np.ones((len(centers), 1))
+        popularity = popularity / np.where(max_popularity > 0, max_popularity, 1)
+
+        # Clusters x meal times x menus
+        prior = (popularity[:, None, :] * nutrient_table.meal_times.T[None, :, :]).astype(np.float32)
+        prior.setflags(write=False)
+
+        return {"centers": centers, "menu_ids": menu_ids, "prior": prior, "expires_at": time.monotonic() + self.ttl}
+
+    def __rebuild_in_background(self, feature_matrix, nutrient_table):
+        def rebuild():
+            db = database.SessionLocal()
+            try:
+                self._state = self.build(db, feature_matrix, nutrient_table)
+            except Exception as e:
+                print(f'Could not rebuild the cold-start prior: {e}')
+            finally:
+                db.close()
+                self._rebuilding = False
+
+        self._rebuilding = True
+        threading.Thread(target=rebuild, name="cold-start-prior", daemon=True).start()
+
+    def load(self, db, feature_matrix, nutrient_table):
+        """Build the prior now, e.g. at startup, so no request waits for the clustering."""
+
+        start = time.perf_counter()
+        with self._lock:
+            self._state = self.build(db, feature_matrix, nutrient_table)
+        print(f'Built the cold-start prior of {len(feature_matrix.menu_ids)} menus in {time.perf_counter() - start:.2f} s.')
+
+    def state(self, db, feature_matrix, nutrient_table) -> dict:
+        """Get the latest prior, building it now only if there is none yet.
+
+        A prior that expired or was built for other menus keeps being served while it is rebuilt in the background.
+        """
+
+        state = self._state
+        if state is None:
+            with self._lock:
+                state = self._state
+                if state is None:
+                    state = self._state = self.build(db, feature_matrix, nutrient_table)
+        elif state["expires_at"] < time.monotonic() or not np.array_equal(state["menu_ids"], feature_matrix.menu_ids):
+            with self._lock:
+                if not self._rebuilding:
+                    self.__rebuild_in_background(feature_matrix, nutrient_table)
+        return state
+
+    @staticmethod
+    def nearest_cluster(state: dict, user_row) -> int:
+        user_row = np.asarray(user_row.todense() if hasattr(user_row, "todense") else user_row, dtype=np.float64).ravel()
+        return int(np.argmin(((state["centers"] - user_row)**2).sum(axis=1)))
+
+    def scores(self, db, feature_matrix, nutrient_table, user_row, meal_time: str) -> np.ndarray:
+        """Get the prior of every menu for a user's feature row and meal time, in the menu order of the feature matrix."""
+
+        state = self.state(db, feature_matrix, nutrient_table)
+        prior = state["prior"][self.nearest_cluster(state, user_row), MEAL_TIMES.index(meal_time)]
+        if np.array_equal(state["menu_ids"], feature_matrix.menu_ids):
+            return prior
+
+        # Until the rebuild for the current menus finishes, map the previous prior onto them, where new menus get the mean prior
+        menu_rows = {menu_id: row for row, menu_id in enumerate(state["menu_ids"].tolist())}
+        rows = np.array([menu_rows.get(menu_id, -1) for menu_id in feature_matrix.menu_ids], dtype=np.int64)
+        if len(prior) == 0:
+            return np.zeros(len(rows), dtype=np.float32)
+        return np.where(rows >= 0, prior[rows], prior.mean()).astype(np.float32)
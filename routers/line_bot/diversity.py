@@ -0,0 +1,68 @@
+# Import general libraries
+import numpy as np
+
+
+def mmr_rerank(relevance: np.ndarray, similarity: np.ndarray, n: int, diversity: float) -> np.ndarray:
+    """Pick n items of a shortlist by maximal marginal relevance.
+
+    Each step picks the item with the best (1 - diversity) * relevance - diversity * max similarity
+    to the items picked so far. The max similarity of every item is kept in one vector that is
+    updated with the row of the picked item, so the cost is O(n * K) for a shortlist of K items.
+
+    Args:
+        relevance (np.ndarray): Score of each shortlisted item.
+        similarity (np.ndarray): K x K similarity between the shortlisted items.
+        n (int): Number of items to pick.
+        diversity (float): Weight of the similarity to the picked items, where 0 keeps the relevance order.
+
+    Returns:
+        picked (np.ndarray): Positions in the shortlist of the picked items in pick order.
+    """
+
+    relevance = np.asarray(relevance, dtype=np.float64)
+    n = min(n, len(relevance))
+
+    max_similarity = np.zeros(len(relevance), dtype=np.float64)
+    available = np.ones(len(relevance), dtype=bool)
+    picked = np.empty(n, dtype=np.int64)
+    for step in range(n):
+        marginal_relevance = np.where(available, (1 - diversity) * relevance - diversity * max_similarity, -np.inf)
+        position = int(np.argmax(marginal_relevance))
+        picked[step] = position
+        available[position] = False
+        np.maximum(max_similarity, similarity[position], out=max_similarity)
+    return picked
+
+
+def mmr_rerank_batch(relevance: np.ndarray, similarity: np.ndarray, n: int, diversity: float) -> np.ndarray:
+    """Pick n items of the shortlist of each user by maximal marginal relevance, all users at once.
+
+    Same steps as mmr_rerank, with one row per user, so the loop runs n times for the whole batch.
+    Items with non-finite relevance, e.g. menus excluded by dietary constraints, are picked last.
+
+    Args:
+        relevance (np.ndarray): users x K score of each shortlisted item.
+        similarity (np.ndarray): users x K x K similarity between the shortlisted items of each user.
+        n (int): Number of items to pick per user.
+        diversity (float): Weight of the similarity to the picked items, where 0 keeps the relevance order.
+
+    Returns:
+        picked (np.ndarray): users x n positions in each user's shortlist of the picked items in pick order.
+    """
+
+    relevance = np.asarray(relevance, dtype=np.float64)
+    relevance = np.where(np.isfinite(relevance), relevance, -1e300)
+    n_users, shortlist_size = relevance.shape
+    n = min(n, shortlist_size)
+
+    users = np.arange(n_users)
+    max_similarity = np.zeros(relevance.shape, dtype=np.float64)
+    available = np.ones(relevance.shape, dtype=bool)
+    picked = np.empty((n_users, n), dtype=np.int64)
+    for step in range(n):
+        marginal_relevance = np.where(available, (1 - diversity) * relevance - diversity * max_similarity, -np.inf)
+        positions = np.argmax(marginal_relevance, axis=1)
+        picked[:, step] = positions
+        available[users, positions] = False
+        np.maximum(max_similarity, similarity[users, positions], out=max_similarity)
+    return picked
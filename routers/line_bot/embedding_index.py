@@ -0,0 +1,65 @@
+# Import general libraries
+import numpy as np
+
+# Import libraries for recommendation
+from scipy.sparse import csr_matrix
+
+
+class EmbeddingIndex:
+    """Precomputed item representations of a LightFM model.
+
+    Scoring a user against all menus is one matrix-vector product of the item embeddings with the
+    user representation, which gives the same scores as model.predict without re-projecting the
+    item features through the embeddings on every request.
+    """
+
+    def __init__(self, model, item_features):
+        self.model = model
+        self.item_features = item_features
+
+        # Project the item features through the item embeddings once
+        item_biases, item_embeddings = model.get_item_representations(csr_matrix(item_features, dtype=np.float32))
+        self.item_biases = np.ascontiguousarray(item_biases, dtype=np.float32)
+        self.item_embeddings = np.ascontiguousarray(item_embeddings, dtype=np.float32)
+        self.item_biases.setflags(write=False)
+        self.item_embeddings.setflags(write=False)
+
+    def __len__(self):
+        return len(self.item_biases)
+
+    def is_built_for(self, model, item_features) -> bool:
+        return self.model is model and self.item_features is item_features
+
+    def user_representation(self, user_index: int, user_features) -> tuple:
+        """Get the bias and the embedding of a user from the user's feature row only."""
+
+        user_row = csr_matrix(user_features[user_index], dtype=np.float32)
+        user_bias = float((user_row @ self.model.user_biases)[0])
+        user_embedding = np.asarray(user_row @ self.model.user_embeddings, dtype=np.float32).ravel()
+        return user_bias, user_embedding
+
+    def score(self, user_index: int, user_features, item_indices=None) -> np.ndarray:
+        """Get the preference score of every menu for a user, or of the given menu rows only."""
+
+        user_bias, user_embedding = self.user_representation(user_index, user_features)
+        if item_indices is None:
+            return self.item_embeddings @ user_embedding + self.item_biases + user_bias
+        return self.item_embeddings[item_indices] @ user_embedding + self.item_biases[item_indices] + user_bias
+
+    def score_users(self, user_indices, user_features, item_indices=None) -> np.ndarray:
+        """Get the preference scores of a batch of users as a users x menus matrix, or users x given menu rows."""
+
+        user_rows = csr_matrix(user_features[user_indices], dtype=np.float32)
+        user_biases = np.asarray(user_rows @ self.model.user_biases, dtype=np.float32).ravel()
+        user_embeddings = np.asarray(user_rows @ self.model.user_embeddings, dtype=np.float32)
+        if item_indices is None:
+            return user_embeddings @ self.item_embeddings.T + self.item_biases + user_biases[:, None]
+        return user_embeddings @ self.item_embeddings[item_indices].T + self.item_biases[item_indices] + user_biases[:, None]
+
+    @staticmethod
+    def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """Get the indices of the k highest scores in ascending index order."""
+
+        if k >= len(scores):
+            return np.arange(len(scores))
+        return np.sort(np.argpartition(-scores, k - 1)[:k])
@@ -0,0 +1,277 @@
+# Import general libraries
+import time
+import threading
+import numpy as np
+
+# Import libraries for recommendation
+from scipy.sparse import csr_matrix
+
+# Import database
+import routers.menu.crud as menu_crud
+import routers.user.crud as user_crud
+import routers.user_feature.crud as user_feature_crud
+
+
+# One-hot encoding of the user gender
+GENDER_MAPPING = {
+    "Male": (0, 1),
+    "Female": (1, 0)
+}
+
+# User preference columns, where feature ID i is column i - 1
+USER_PREFERENCES = ['cheap', 'chicken', 'fried', 'pork', 'salty', 'soup', 'spicy', 'steam', 'sweet', 'vegetable']
+
+# Menu feature columns of the item feature matrix
+MENU_FEATURES = ['spicy', 'high_sugar', 'high_fat', 'high_calorie', 'is_light', 'is_fried', 'contain_water', 'has_vegetable',
+                 'high_sodium', 'high_protein', 'high_carbohydrate', 'high_cholesterol', 'has_chicken', 'has_pork', 'has_noodle', 'high_price']
+
+
+class _GrowableRows:
+    """2-D array with amortized O(1) row appends."""
+
+    def __init__(self, n_columns: int, capacity: int = 64):
+        self._data = np.zeros((capacity, n_columns), dtype=np.float64)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def array(self) -> np.ndarray:
+        return self._data[:self._size]
+
+    def append(self, row) -> int:
+        if self._size == len(self._data):
+            grown = np.zeros((2 * len(self._data), self._data.shape[1]), dtype=np.float64)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size] = row
+        self._size += 1
+        return self._size - 1
+
+
+class FeatureMatrixService:
+    """Keep the user and item feature matrices of the recommender in memory.
+
+    The matrices are loaded from the database once and then updated from the user, user feature
+    and menu feature signals, so a recommendation request only reads the cached CSR matrices.
+    The signals only reach the worker that made the change, so every refresh_interval seconds the
+    service also reads the users and user features added since the last read and the menu features
+    from the database, and an unknown user is looked up right away. Users are rows in ascending
+    user ID when loaded and appended in the order they are seen afterwards. Menus are rows in
+    ascending menu ID.
+    """
+
+    def __init__(self, refresh_interval: float = 30.0):
+        self._lock = threading.RLock()
+        self._loaded = False
+
+        # Changes made through other workers are read at most every refresh_interval seconds
+        self.refresh_interval = refresh_interval
+        self._synced_at = None
+        self._max_user_id = 0
+        self._max_user_feature_id = 0
+
+        # Raw user columns: age, height and weight (min-max scaled on read), gender and preferences
+        self._user_row = {}
+        self._user_numerical = _GrowableRows(3)
+        self._user_gender = _GrowableRows(2)
+        self._user_preferences = _GrowableRows(len(USER_PREFERENCES))
+        self._numerical_min = None
+        self._numerical_max = None
+
+        # Menu feature rows
+        self._menu_ids = []
+        self._menu_features = np.zeros((0, len(MENU_FEATURES)), dtype=np.float64)
+
+        # Cached sparse matrices, rebuilt on the first read after a change
+        self._user_features_sparse = None
+        self._item_features_sparse = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, db):
+        """Load all users, user preferences and menu features from the database."""
+
+        with self._lock:
+            self._user_row = {}
+            self._user_numerical = _GrowableRows(3)
+            self._user_gender = _GrowableRows(2)
+            self._user_preferences = _GrowableRows(len(USER_PREFERENCES))
+            self._numerical_min = None
+            self._numerical_max = None
+
+            # User features added after this ID are read by the next sync, which recounts the preferences of their users
+            self._max_user_feature_id = user_feature_crud.get_max_user_feature_id(db=db)
+
+            for user in user_crud.get_users(db=db):
+                self.__append_user(user)
+
+            for user_preferences in user_feature_crud.get_user_features_flag(db=db):
+                row = self._user_row.get(user_preferences.user_id)
+                if row is not None:
+                    self._user_preferences.array[row] = [getattr(user_preferences, name) for name in USER_PREFERENCES]
+
+            menu_features = menu_crud.get_menu_features(db=db)
+            self._menu_ids = [menu_feature.menu_id for menu_feature in menu_features]
+            self._menu_features = np.array([[getattr(menu_feature, name) for name in MENU_FEATURES] for menu_feature in menu_features], dtype=np.float64).reshape(-1, len(MENU_FEATURES))
+
+            self._user_features_sparse = None
+            self._item_features_sparse = None
+            self._synced_at = time.monotonic()
+            self._loaded = True
+
+    def ensure_loaded(self, db):
+        """Load the matrices on the first call, and read the changes of other workers when the refresh interval has passed."""
+
+        if not self._loaded:
+            self.load(db)
+        elif self._synced_at is None or time.monotonic() - self._synced_at >= self.refresh_interval:
+            self.sync(db)
+
+    def sync(self, db):
+        """Read the users and user features added since the last read and the changed menu features from the database."""
+
+        with self._lock:
+            if not self._loaded:
+                self.load(db)
+                return
+            self._synced_at = time.monotonic()
+
+            # New users, where users already added by a signal are skipped
+            for user in user_crud.get_users_after(db=db, user_id=self._max_user_id):
+                if user.id not in self._user_row:
+                    self.__append_user(user)
+                    self._user_features_sparse = None
+                self._max_user_id = max(self._max_user_id, user.id)
+
+            # Recount the preferences of the users with new user features, which is idempotent unlike adding them up
+            user_features = user_feature_crud.get_user_features_after(db=db, user_feature_id=self._max_user_feature_id)
+            if user_features:
+                self._max_user_feature_id = max(user_feature.id for user_feature in user_features)
+                for user_id in {user_feature.user_id for user_feature in user_features}:
+                    self.__recount_preferences(db, user_id)
+
+            # Replace the menu features if any menu feature was added or updated
+            menu_features = menu_crud.get_menu_features(db=db)
+            menu_ids = [menu_feature.menu_id for menu_feature in menu_features]
+            features = np.array([[getattr(menu_feature, name) for name in MENU_FEATURES] for menu_feature in menu_features], dtype=np.float64).reshape(-1, len(MENU_FEATURES))
+            if menu_ids != self._menu_ids or not np.array_equal(features, self._menu_features):
+                self._menu_ids = menu_ids
+                self._menu_features = features
+                self._item_features_sparse = None
+
+    def __recount_preferences(self, db, user_id: int):
+        row = self._user_row.get(user_id)
+        if row is None:
+            return
+
+        preferences = np.zeros(len(USER_PREFERENCES))
+        for user_feature in user_feature_crud.get_user_feature_by_user_id(db=db, user_id=user_id):
+            if 1 <= user_feature.feature_id <= len(USER_PREFERENCES):
+                preferences[user_feature.feature_id - 1] += 1
+        if not np.array_equal(self._user_preferences.array[row], preferences):
+            self._user_preferences.array[row] = preferences
+            self._user_features_sparse = None
+
+    def __load_user(self, db, user_id: int):
+        user = user_crud.get_user(db=db, user_id=user_id)
+        if user is None:
+            return
+        self.__append_user(user)
+        self.__recount_preferences(db, user_id)
+        self._user_features_sparse = None
+
+    def __append_user(self, user):
+        numerical = np.array([2023 - user.birth_date.year, user.height, user.weight], dtype=np.float64)
+
+        self._user_row[user.id] = self._user_numerical.append(numerical)
+        self._max_user_id = max(self._max_user_id, user.id)
+        self._user_gender.append(GENDER_MAPPING[user.gender])
+        self._user_preferences.append(np.zeros(len(USER_PREFERENCES)))
+
+        # Update the min-max scaling statistics
+        if self._numerical_min is None:
+            self._numerical_min = numerical.copy()
+            self._numerical_max = numerical.copy()
+        else:
+            np.minimum(self._numerical_min, numerical, out=self._numerical_min)
+            np.maximum(self._numerical_max, numerical, out=self._numerical_max)
+
+    # Signal receivers. Changes before the first load are skipped since the load reads them from the database.
+    def add_user(self, user, **kwargs):
+        with self._lock:
+            if not self._loaded or user.id in self._user_row:
+                return
+            self.__append_user(user)
+            self._user_features_sparse = None
+
+    def add_user_features(self, user_id: int, feature_ids: list, **kwargs):
+        # The user features are recounted from the database by the next read, so a feature is never counted twice
+        self._synced_at = None
+
+    def update_menu_feature(self, menu_feature, **kwargs):
+        with self._lock:
+            if not self._loaded:
+                return
+
+            features = [getattr(menu_feature, name) for name in MENU_FEATURES]
+            row = int(np.searchsorted(self._menu_ids, menu_feature.menu_id))
+            if row < len(self._menu_ids) and self._menu_ids[row] == menu_feature.menu_id:
+                self._menu_features[row] = features
+            else:
+                self._menu_ids.insert(row, menu_feature.menu_id)
+                self._menu_features = np.insert(self._menu_features, row, features, axis=0)
+            self._item_features_sparse = None
+
+    def user_index(self, user_id: int, db=None):
+        """Get the row of the user in the user feature matrix, or None if the user is unknown.
+
+        With a database session, a user not known yet, e.g. created through another worker, is read from the database.
+        """
+
+        row = self._user_row.get(user_id)
+        if row is None and db is not None and self._loaded:
+            with self._lock:
+                if user_id not in self._user_row:
+                    self.__load_user(db, user_id)
+                row = self._user_row.get(user_id)
+        return row
+
+    @property
+    def user_ids(self) -> list:
+        """Get the user IDs in row order of the user feature matrix."""
+        return list(self._user_row)
+
+    @property
+    def menu_ids(self) -> list:
+        return list(self._menu_ids)
+
+    @property
+    def scaling_stats(self) -> tuple:
+        """Get the min and max of age, height and weight used for min-max scaling."""
+        return self._numerical_min, self._numerical_max
+
+    def get_user_features(self) -> csr_matrix:
+        """Get the user feature matrix: scaled age, height, weight, gender one-hot and preference counts."""
+
+        with self._lock:
+            if self._user_features_sparse is None:
+                numerical = self._user_numerical.array
+                if len(numerical):
+                    # Same scaling as MinMaxScaler, where a constant column is scaled to 0
+                    numerical_range = self._numerical_max - self._numerical_min
+                    numerical_range[numerical_range == 0] = 1
+                    numerical = (numerical - self._numerical_min) / numerical_range
+                self._user_features_sparse = csr_matrix(np.hstack((numerical, self._user_gender.array, self._user_preferences.array)))
+            return self._user_features_sparse
+
+    def get_item_features(self) -> csr_matrix:
+        """Get the item feature matrix of the menu features."""
+
+        with self._lock:
+            if self._item_features_sparse is None:
+                self._item_features_sparse = csr_matrix(self._menu_features)
+            return self._item_features_sparse
@@ -1,15 +1,47 @@
 # Import general libraries
+import os
+import threading
 import numpy as np
-from PIL import Image
 
-# Import Keras libraries
-from tensorflow.keras.models import Model, model_from_json
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.applications.vgg19 import preprocess_input as preprocess_input_vgg19
-from tensorflow.keras.applications.inception_v3 import preprocess_input as preprocess_input_inception_v3
+# Import image preprocessing
+from routers.line_bot.image_preprocessing import PreparedImage
 
-# Import Onnx runtime
-import onnxruntime as ort
+# Import Onnx sessions
+from routers.line_bot.onnx_sessions import OnnxSessionManager, variant_model_path, session_manager as shared_session_manager
+from routers.line_bot.inference_batcher import InferenceBatcher
+from routers.line_bot.recognition_cache import RecognitionCache, difference_hash
+
+
+# Recognition modes, where "gate" runs VGG-19 on every image and "cascade" runs it only on ambiguous images
+RECOGNITION_MODES = ("gate", "cascade")
+
+# Food probability of the VGG-19 output at or above which an image is food, as quantized models do not output exactly 1
+FOOD_THRESHOLD = 0.5
+
+
+def menu_confidence(predictions: np.ndarray) -> tuple:
+    """Get the top-1 probability and the normalized entropy, in [0, 1], of the InceptionV3 predictions of one image."""
+
+    scores = np.asarray(predictions, dtype=np.float64).ravel()
+
+    # Use the outputs as probabilities if they already are, and apply softmax to logits otherwise
+    if scores.min() < 0 or abs(scores.sum() - 1) > 1e-3:
+        scores = np.exp(scores - scores.max())
+        scores /= scores.sum()
+
+    nonzero = scores[scores > 0]
+    entropy = float(-(nonzero * np.log(nonzero)).sum() / np.log(len(scores))) if len(scores) > 1 else 0.0
+    return float(scores.max()), entropy
+
+
+def cascade_decision(confidence: float, entropy: float, accept_confidence: float, accept_entropy: float, reject_confidence: float) -> str:
+    """Decide from the InceptionV3 confidence whether an image is food ("accept"), not food ("reject") or needs the VGG-19 gate ("ambiguous")."""
+
+    if confidence >= accept_confidence and entropy <= accept_entropy:
+        return "accept"
+    if confidence < reject_confidence:
+        return "reject"
+    return "ambiguous"
 
 
 class FoodRecognition:
@@ -24,69 +56,164 @@ class FoodRecognition:
     inception_v3_model_path = "./assets/models/inception-v3_initial.onnx"
     
     
-    def __create_onnx_session(self, model_path):
+    def __init__(self, session_manager: OnnxSessionManager = None, max_batch_size: int = None, max_batch_wait_ms: float = None):
         
-        # Load Onnx model
-        onnx_session = ort.InferenceSession(model_path)
+        # Sessions are created once per process and shared by all requests
+        self.session_manager = session_manager or shared_session_manager
         
-        # Get model input and output names
-        input_name = onnx_session.get_inputs()[0].name
-        output_name = onnx_session.get_outputs()[0].name
+        # Use the configured precision variant of each model
+        self.vgg19_model_path = self.__precision_model_path(self.vgg19_model_path, os.getenv("RECOGNITION_VGG19_PRECISION", "fp32"))
+        self.inception_v3_model_path = self.__precision_model_path(self.inception_v3_model_path, os.getenv("RECOGNITION_INCEPTION_V3_PRECISION", "fp32"))
         
-        return onnx_session, input_name, output_name
-
+        # Concurrent images are batched per model, unless the largest batch is 1
+        self.max_batch_size = max_batch_size if max_batch_size is not None else int(os.getenv("RECOGNITION_MAX_BATCH_SIZE", "8"))
+        self.max_batch_wait_ms = max_batch_wait_ms if max_batch_wait_ms is not None else float(os.getenv("RECOGNITION_MAX_BATCH_WAIT_MS", "5"))
+        self.__batchers = {}
+        self.__batchers_lock = threading.Lock()
+        
+        # In cascade mode, confident InceptionV3 predictions are accepted or rejected without the VGG-19 gate
+        self.mode = os.getenv("RECOGNITION_MODE", "gate")
+        if self.mode not in RECOGNITION_MODES:
+            raise ValueError(f'Invalid recognition mode: {self.mode}')
+        self.accept_confidence = float(os.getenv("RECOGNITION_ACCEPT_CONFIDENCE", "0.85"))
+        self.accept_entropy = float(os.getenv("RECOGNITION_ACCEPT_ENTROPY", "0.35"))
+        self.reject_confidence = float(os.getenv("RECOGNITION_REJECT_CONFIDENCE", "0.3"))
+        
+        # Repeated and near-identical photos are answered from the cache without running the models
+        self.recognition_cache = RecognitionCache(
+            max_size=int(os.getenv("RECOGNITION_CACHE_SIZE", "1024")),
+            max_distance=int(os.getenv("RECOGNITION_CACHE_MAX_DISTANCE", "4"))
+        )
+    
     
-    def __preprocess_image(self, model_name, img_byte):
+    @staticmethod
+    def __precision_model_path(model_path, precision):
         
-        # Load and resize image
-        # food_img = image.load_img(img_path, target_size=(224, 224))
+        # Fall back to the FP32 model if the variant has not been made or downloaded
+        precision_model_path = variant_model_path(model_path, precision)
+        if precision_model_path != model_path and not os.path.exists(precision_model_path):
+            print(f'The {precision} model "{precision_model_path}" does not exist. Using "{model_path}" instead.')
+            return model_path
+        return precision_model_path
+    
+    
+    def load(self, warm_up: bool = True):
+        
+        # Create and warm up the sessions of both models, e.g. at startup
+        self.session_manager.load([self.vgg19_model_path, self.inception_v3_model_path], warm_up=warm_up)
 
-        # Convert image byte to PIL image and resize it
-        img_pil = Image.open(img_byte)
-        img_pil = img_pil.resize((224, 224))
+        # Cached results may come from other models, e.g. after the model paths were changed
+        self.recognition_cache.clear()
 
-        # Convert image to Numpy array and expand its dimension
-        img_arr = image.img_to_array(img_pil)
-        img_arr = np.expand_dims(img_arr, axis=0)
+    
+    def __run(self, model_path, img_arr):
         
-        # Preprocess image
-        if model_name == "vgg19":
-            img_arr = preprocess_input_vgg19(img_arr)
-        elif model_name == "inception_v3":
-            img_arr = preprocess_input_inception_v3(img_arr)
-        else:
-            raise ValueError("Invalid model name.")
-
-        return img_arr
+        # Run the model directly if batching is off
+        if self.max_batch_size <= 1:
+            return self.session_manager.get(model_path).run(img_arr)
+        
+        # Otherwise run the image as part of a batch of concurrent images
+        batcher = self.__batchers.get(model_path)
+        if batcher is None:
+            with self.__batchers_lock:
+                batcher = self.__batchers.get(model_path)
+                if batcher is None:
+                    batcher = InferenceBatcher(self.session_manager.get(model_path), max_batch_size=self.max_batch_size, max_wait=self.max_batch_wait_ms / 1000)
+                    self.__batchers[model_path] = batcher
+        return batcher.run(img_arr)
     
     
-    def is_food(self, img_byte):
+    def stop(self):
         
-        # Create Onnx session for VGG-19 model
-        vgg19_onnx_session, vgg19_input_name, vgg19_output_name = self.__create_onnx_session(self.vgg19_model_path)
+        # Stop the batching workers
+        with self.__batchers_lock:
+            for batcher in self.__batchers.values():
+                batcher.stop()
+            self.__batchers.clear()
+    
+    
+    def batching_stats(self):
+        return {model_path: batcher.stats() for model_path, batcher in list(self.__batchers.items())}
+    
+    
+    def prepare_image(self, img_byte):
         
-        # Get preprocessed image
-        img_arr = self.__preprocess_image(model_name="vgg19", img_byte=img_byte)
-
-        # Predict image
-        predictions = vgg19_onnx_session.run([vgg19_output_name], {vgg19_input_name: img_arr})[0]
+        # Decode and resize the image once for both models, unless it is already prepared
+        if isinstance(img_byte, PreparedImage):
+            return img_byte
+        return PreparedImage.from_bytes(img_byte)
+    
+    
+    def food_predictions(self, img_byte):
+        
+        # Predict image with VGG-19 model
+        return self.__run(self.vgg19_model_path, self.prepare_image(img_byte).vgg19_input())
+    
+    
+    def menu_predictions(self, img_byte):
+        
+        # Predict image with InceptionV3 model
+        return self.__run(self.inception_v3_model_path, self.prepare_image(img_byte).inception_v3_input())
+    
+    
+    def is_food(self, img_byte):
+        
+        # Food/non-food prediction of VGG-19 model
+        predictions = self.food_predictions(img_byte)
 
-        return predictions[0][0] == 1
+        return predictions[0][0] >= FOOD_THRESHOLD
 
 
     def recognize_menu(self, img_byte):
         
-        # Create Onnx session for VGG-19 model
-        inception_v3_onnx_session, inception_v3_input_name, inception_v3_output_name = self.__create_onnx_session(self.inception_v3_model_path)
-        
-        # Get preprocessed image
-        img_arr = self.__preprocess_image(model_name="inception_v3", img_byte=img_byte)
-
-        # Predict image
-        predictions = inception_v3_onnx_session.run([inception_v3_output_name], {inception_v3_input_name: img_arr})[0]
+        # Menu predictions of InceptionV3 model
+        predictions = self.menu_predictions(img_byte)
 
         # Post-process predictions
         predicted_menu_id = int(np.argmax(predictions))
 
         return predicted_menu_id
+    
+    
+    def recognize(self, img_byte):
+        """Check if an image contains food and recognize its menu with the configured mode.
 
+        Args:
+            img_byte (bytes | BytesIO | PreparedImage): Image to recognize.
+
+        Returns:
+            result (dict): "is_food", "menu_id" (None if not food), "decision", "models" run and whether the result was "cached".
+        """
+        
+        img = self.prepare_image(img_byte)
+        
+        # Answer repeated photos from the cache
+        image_hash = difference_hash(img.pixels)
+        cached_result = self.recognition_cache.get(image_hash)
+        if cached_result is not None:
+            return {**cached_result, "models": [], "cached": True}
+        
+        result = self.__recognize(img)
+        self.recognition_cache.put(image_hash, result)
+        return {**result, "cached": False}
+    
+    
+    def __recognize(self, img):
+        
+        # Gate mode: VGG-19 decides and InceptionV3 only runs on food
+        if self.mode == "gate":
+            if not self.is_food(img):
+                return {"is_food": False, "menu_id": None, "decision": "gate", "models": ["vgg19"]}
+            return {"is_food": True, "menu_id": self.recognize_menu(img), "decision": "gate", "models": ["vgg19", "inception_v3"]}
+        
+        # Cascade mode: InceptionV3 decides when it is confident and VGG-19 only runs in the ambiguous band
+        predictions = self.menu_predictions(img)
+        confidence, entropy = menu_confidence(predictions)
+        decision = cascade_decision(confidence, entropy, self.accept_confidence, self.accept_entropy, self.reject_confidence)
+        models = ["inception_v3"]
+        if decision == "ambiguous":
+            is_food = bool(self.is_food(img))
+            models.append("vgg19")
+        else:
+            is_food = decision == "accept"
+        return {"is_food": is_food, "menu_id": int(np.argmax(predictions)) if is_food else None, "decision": decision, "models": models}
@@ -1,13 +1,14 @@
 # Import general libraries
+import os
 import random
 import numpy as np
 import pandas as pd
 from dotenv import load_dotenv, find_dotenv
 import pickle
+from types import MappingProxyType
 
 # Import LightFM and other libraries for recommendation
 from lightfm import LightFM
-from lightfm.evaluation import precision_at_k, recall_at_k, auc_score
 from sklearn.preprocessing import OneHotEncoder, MinMaxScaler
 from scipy.sparse import csr_matrix, hstack
 from sklearn.metrics.pairwise import cosine_similarity
@@ -19,23 +20,83 @@ import database
 import routers.menu.crud as menu_crud
 import routers.order.crud as order_crud
 import routers.user.crud as user_crud
+import routers.recommendation.crud as recommendation_crud
+from routers.line_bot.menu_catalog import NutrientTable, MenuCatalog, NUTRIENTS, MEAL_TIMES
+from routers.line_bot.similarity_store import SimilarityStore
+from routers.line_bot.feature_matrix import FeatureMatrixService
+from routers.line_bot.model_holder import ModelHolder
+import routers.line_bot.model_artifact as model_artifact
+from routers.line_bot.embedding_index import EmbeddingIndex
+from routers.line_bot.candidate_index import CandidateIndex
+from routers.line_bot.diversity import mmr_rerank, mmr_rerank_batch
+from routers.line_bot.cold_start import ColdStartPrior
+from routers.line_bot.recommendation_cache import RecommendationCache
+import signals
 
 
-# Initialize database session
-db = database.SessionLocal()
-
 
 class FoodRecommendation:
+
+    # Declare path of the pickled LightFM recommendation model
+    model_path = "assets/models/rec_model.pickle"
+
+    # Declare directory of the memory-mapped model artifact used for serving
+    artifact_dir = "assets/models/rec_model"
        
     def __init__(self):
         self.df_food_feature = pd.read_csv('assets/mock_data/Food dataset final - Food dataset - Sheet2.csv')
         self.df_poll = pd.read_csv('assets/mock_data/Contact Information (Responses) - Form responses 1(1).csv')
         self.nutrient_data = self.df_food_feature.iloc[:, 0:13].to_dict('index')
 
+        # Menus and their nutrient table, reloaded only when the menus change
+        self.menu_catalog = MenuCatalog()
+        signals.menu_changed.connect(self.menu_catalog.invalidate)
+
+        # Item similarity of the menu features, recomputed only when the menus change
+        self.similarity_store = SimilarityStore()
+        signals.menu_changed.connect(self.similarity_store.invalidate)
+        signals.menu_feature_changed.connect(self.similarity_store.invalidate)
+
+        # User and item feature matrices, updated in place when users, user features or menus change, and synced with changes of other workers
+        self.feature_matrix = FeatureMatrixService(refresh_interval=float(os.getenv("RECOMMENDATION_FEATURE_REFRESH_INTERVAL", "30")))
+        signals.user_created.connect(self.feature_matrix.add_user)
+        signals.user_features_created.connect(self.feature_matrix.add_user_features)
+        signals.menu_feature_changed.connect(self.feature_matrix.update_menu_feature)
+
+        # Recommendation model, memory-mapped once at startup and swapped when a new artifact is published
+        self.model_holder = ModelHolder(os.path.join(self.artifact_dir, model_artifact.MANIFEST_NAME), loader=model_artifact.load_model)
+
+        # Item representations of the current model, precomputed when the model loads
+        self.n_candidates = int(os.getenv("RECOMMENDATION_CANDIDATES", "0")) or None
+        self._embedding_index = None
+        self.model_holder.on_swap(self.get_embedding_index)
+
+        # Menu feature bitmasks of the dietary constraints, rebuilt when the menu features change
+        self._candidate_index = None
+
+        # Weight of the diversity re-ranking of the shortlist, where 0 disables it, so the re-ranking is opt-in
+        self.diversity = float(os.getenv("RECOMMENDATION_DIVERSITY", "0.0"))
+        self.diversity_shortlist = int(os.getenv("RECOMMENDATION_DIVERSITY_SHORTLIST", "30"))
+
+        # Popularity x meal-time prior per user feature cluster for users without orders, rebuilt hourly
+        self.cold_start_prior = ColdStartPrior(
+            n_clusters=int(os.getenv("RECOMMENDATION_COLD_START_CLUSTERS", "8")),
+            ttl=float(os.getenv("RECOMMENDATION_COLD_START_TTL", "3600"))
+        )
+        signals.menu_changed.connect(self.cold_start_prior.invalidate)
+
+        # Recommendation results of repeated requests, invalidated when the user orders or the menus change
+        self.recommendation_cache = RecommendationCache(
+            max_size=int(os.getenv("RECOMMENDATION_CACHE_SIZE", "10000")),
+            ttl=float(os.getenv("RECOMMENDATION_CACHE_TTL", "300"))
+        )
+        signals.order_created.connect(self.recommendation_cache.invalidate_user)
+        signals.menu_changed.connect(self.recommendation_cache.clear)
+
     def get_user_features(self):
-        # Transform food preferences
-        self.df_poll['Food Preferences (choose what you like)'] = self.df_poll['Food Preferences (choose what you like)'].str.split(',').map(lambda x_list: [x.strip() for x in x_list])
-        user_prefer_dummies = self.df_poll['Food Preferences (choose what you like)'].str.join('|').str.get_dummies()
+        # Transform food preferences without modifying the poll data, so repeated and concurrent calls see the same input
+        food_preferences = self.df_poll['Food Preferences (choose what you like)'].str.split(',').map(lambda x_list: [x.strip() for x in x_list])
+        user_prefer_dummies = food_preferences.str.join('|').str.get_dummies()
         
         # Transform gender
         enc = OneHotEncoder(sparse=False)
@@ -84,107 +145,483 @@ class FoodRecommendation:
         # Fit the model on your interaction matrix and user/food features
         model.fit(interaction_matrix, user_features=user_features, item_features=food_features, epochs=30)
         
-        with open('assets/models/rec_model.pickle', 'wb') as fle:
+        self.save_model(model)
+
+    def save_model(self, model, model_path=None, user_ids=None, menu_ids=None):
+        """Save the pickled model for retraining and, for the default path, export its serving artifact."""
+
+        export = model_path is None
+        model_path = model_path or self.model_path
+
+        # Write to a temporary file and rename it, so a reader never loads a partial pickle
+        tmp_path = f"{model_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as fle:
             pickle.dump(model, fle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, model_path)
+
+        if export:
+            model_artifact.export_model(model, self.artifact_dir, user_ids=user_ids, menu_ids=menu_ids)
             
-    def load_model(self):
-        with open('assets/models/rec_model.pickle', 'rb') as fle:
+    def load_model(self, model_path=None):
+        with open(model_path or self.model_path, 'rb') as fle:
             model = pickle.load(fle)
             
         return model
+
+    def ensure_model_artifact(self) -> bool:
+        """Export the serving artifact of the pickled model if the artifact is missing or older. Returns True if exported."""
+
+        manifest_path = os.path.join(self.artifact_dir, model_artifact.MANIFEST_NAME)
+        if not os.path.isfile(self.model_path):
+            return False
+        if os.path.isfile(manifest_path) and os.path.getmtime(manifest_path) >= os.path.getmtime(self.model_path):
+            return False
+
+        model_artifact.export_model(self.load_model(), self.artifact_dir)
+        return True
     
-    # Function to return the top n items in a dictionary sorted by value
-    def top_n_items(self, dictionary, n):
-        sorted_items = sorted(dictionary.items(), key=lambda x: x[1]['score'], reverse=True)
-        return dict(sorted_items[:n])
+    # Function to return the indices of the top n scores sorted by score
+    def top_n_indices(self, scores, n):
+        n = min(n, len(scores))
+        if n <= 0:
+            return np.array([], dtype=np.int64)
+
+        # Partition the n best scores to the front, then sort only those by score (ties by index)
+        top_indices = np.argpartition(-scores, n - 1)[:n]
+        return top_indices[np.lexsort((top_indices, -scores[top_indices]))]
     
-    # Function to calculate b value for each nutrient based on min and max nutrient values in the dataset
-    def calculate_b(self, nutrient, nutrient_data, nutritional_goal_left, a1, a2, MinPositiveScore):
-        min_nutrient = min([nutrient_data[food_name][nutrient] for food_name in nutrient_data])
-        max_nutrient = max([nutrient_data[food_name][nutrient] for food_name in nutrient_data])
+    def diversify(self, final_scores, item_rows, food_features, n, diversity=0.0, shortlist_size=30):
+        """Get the positions of n items of the top shortlist_size scores, re-ranked by maximal marginal relevance.
 
-        nutrient_scores = []
-        for total_nutrient in [min_nutrient, max_nutrient]:
-            nutrient_score = -a1 * (total_nutrient - nutritional_goal_left[nutrient])**2 if (nutritional_goal_left[nutrient] - total_nutrient) >= 0 else -a2 * (total_nutrient - nutritional_goal_left[nutrient])**2
-            nutrient_scores.append(nutrient_score)
+        Args:
+            final_scores (np.ndarray): Final score of each item.
+            item_rows (np.ndarray): Row of each item in the menu feature matrix, or -1 if the item has no features.
+            food_features (csr_matrix): Menu feature matrix of the similarity store.
+            n (int): Number of items to pick.
+            diversity (float): Weight of the similarity to the picked items, where 0 keeps the score order.
+            shortlist_size (int): Number of top scored items to re-rank.
 
-        MostNegativeScore = min(nutrient_scores)
-        b_nutrient = abs(MostNegativeScore) + MinPositiveScore
+        Returns:
+            picked (np.ndarray): Positions of the picked items in pick order.
+        """
 
-        return b_nutrient
-    
-    def dynamic_food_recommend(self, model, interaction_matrix, user_id, user_features, food_id, food_names, food_features, nutrient_data, nutritional_goal_left, meal_time, n_recommendations=5, a1=0.001, a2=0.002, w1=0.3, w2=0.2, w3=0.3, w4=0.2, MinPositiveScore = 1):
+        shortlist = self.top_n_indices(final_scores, max(shortlist_size, n))
+        shortlist = shortlist[np.isfinite(final_scores[shortlist])]
+        if diversity <= 0 or len(shortlist) <= 1:
+            return shortlist[:n]
 
-        # Get the index of the user in the interaction matrix
-        user_index = user_id
+        # Similarity between the shortlisted items from the cached similarity rows, where items without features get none
+        shortlist_rows = np.asarray(item_rows, dtype=np.int64)[shortlist]
+        has_features = shortlist_rows >= 0
+        similarity = np.zeros((len(shortlist), len(shortlist)), dtype=np.float64)
+        if has_features.any():
+            similarity[np.ix_(has_features, has_features)] = self.similarity_store.rows(shortlist_rows[has_features], food_features)[:, shortlist_rows[has_features]]
+
+        return shortlist[mmr_rerank(final_scores[shortlist], similarity, n, diversity)]
+
+    def diversify_batch(self, final_scores, food_features, n, diversity=0.0, shortlist_size=30, item_rows=None):
+        """Get the columns of n items of the top shortlist_size scores of each row, re-ranked by maximal marginal relevance.
+
+        The similarity rows of the menus shortlisted by any of the users are fetched once for the whole batch.
+
+        Args:
+            final_scores (np.ndarray): users x menus final scores.
+            food_features (csr_matrix): Menu feature matrix of the similarity store.
+            n (int): Number of items to pick per user.
+            diversity (float): Weight of the similarity to the picked items.
+            shortlist_size (int): Number of top scored items to re-rank per user.
+            item_rows (np.ndarray): Row in the menu feature matrix of each column, or None if the columns are the rows.
+
+        Returns:
+            picked (np.ndarray): users x n columns of the picked items in pick order.
+        """
+
+        # Shortlist of each user sorted by score, ties by column like top_n_indices
+        k = min(max(shortlist_size, n), final_scores.shape[1])
+        shortlist = np.sort(np.argpartition(-final_scores, k - 1, axis=1)[:, :k], axis=1)
+        order = np.argsort(-np.take_along_axis(final_scores, shortlist, axis=1), axis=1, kind='stable')
+        shortlist = np.take_along_axis(shortlist, order, axis=1)
 
-        # Predict scores for all food items for the user
-        scores = model.predict(user_index, np.arange(interaction_matrix.shape[1]), user_features=user_features, item_features=food_features)
+        # Similarity between the shortlisted menus of each user from one fetch of the union of the shortlists
+        menus, positions = np.unique(shortlist, return_inverse=True)
+        positions = positions.reshape(shortlist.shape)
+        feature_rows = menus if item_rows is None else np.asarray(item_rows)[menus]
+        union_similarity = self.similarity_store.rows(feature_rows, food_features)[:, feature_rows]
+        similarity = union_similarity[positions[:, :, None], positions[:, None, :]]
+
+        picked = mmr_rerank_batch(np.take_along_axis(final_scores, shortlist, axis=1), similarity, n, diversity)
+        return np.take_along_axis(shortlist, picked, axis=1)
+
+    # Function to calculate b value for each nutrient based on min and max nutrient values in the dataset
+    def calculate_b(self, nutrient_bounds, goal_left, a1, a2, MinPositiveScore):
+        # The nutrient score is a parabola peaking at the goal, so its minimum over the catalog is at the min or max nutrient value.
+        # goal_left is one goal per nutrient, or a users x nutrients matrix of goals.
+        bounds = np.stack(nutrient_bounds).reshape((2, ) + (1, ) * (np.ndim(goal_left) - 1) + (-1, ))
+        bound_scores = -np.where(goal_left - bounds >= 0, a1, a2) * (bounds - goal_left)**2
 
-        # Calculate the cosine similarity matrix for food items using their features
-        similarities = cosine_similarity(food_features)
+        MostNegativeScore = bound_scores.min(axis=0)
+        b_values = np.abs(MostNegativeScore) + MinPositiveScore
 
-        # Define the minimum and maximum values for normalization
-        b_values = {nutrient: self.calculate_b(nutrient, nutrient_data, nutritional_goal_left, a1, a2, MinPositiveScore) for nutrient in ['Calories', 'Fat', 'Carbs', 'Protein']}
-        MinNutrientScore = {nutrient: -b_values[nutrient] for nutrient in ['Calories', 'Fat', 'Carbs', 'Protein']}
+        return b_values
+    
+    def average_nutrient_scores(self, nutrient_table, indices, nutritional_goal_left, a1, a2, MinPositiveScore):
+        # Get b normalizers from the cached nutrient bounds of the table
+        goal_left = np.array([nutritional_goal_left[nutrient] for nutrient in NUTRIENTS], dtype=np.float64)
+        b_values = self.calculate_b(nutrient_table.nutrient_bounds, goal_left, a1, a2, MinPositiveScore)
+        MinNutrientScore = -b_values
         MaxNutrientScore = b_values
 
-        MinPreference = min(scores)
-        MaxPreference = max(scores)
+        # Calculate and normalize nutrient scores for each menu x nutrient of the given rows
+        nutrients = nutrient_table.nutrients[indices]
+        nutrient_scores = -np.where(goal_left - nutrients >= 0, a1, a2) * (nutrients - goal_left)**2 + b_values
+        normalized_nutrient_scores = (nutrient_scores - MinNutrientScore) / (MaxNutrientScore - MinNutrientScore)
+
+        # Calculate the average nutrient score
+        return normalized_nutrient_scores.mean(axis=1)
+
+    def rank_food_rows(self, model, user_id, user_features, food_id, food_features, nutrient_table, nutritional_goal_left, meal_time, n_recommendations=5, a1=0.001, a2=0.002, w1=0.3, w2=0.2, w3=0.3, w4=0.2, MinPositiveScore = 1, embedding_index=None, n_candidates=None, eligible_rows=None, diversity=0.0, shortlist_size=30):
+        """Get the rows of the top n menus in ranking order (MMR pick order when diversity > 0) and their final scores.
+
+        Rows are indices into the nutrient table and the model items, so menus with the same name stay apart.
+        """
+
+        # Get the index of the user in the interaction matrix
+        user_index = user_id
 
+        # Only the eligible food items of the dietary constraints are scored
+        candidates = np.arange(len(nutrient_table)) if eligible_rows is None else np.asarray(eligible_rows, dtype=np.int64)
+        if len(candidates) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        # Predict scores for the food items for the user, with one matrix-vector product if an embedding index is given
+        if embedding_index is not None:
+            scores = embedding_index.score(user_index, user_features, None if eligible_rows is None else candidates).astype(np.float64)
+        else:
+            scores = np.asarray(model.predict(user_index, candidates, user_features=user_features, item_features=food_features), dtype=np.float64)
+
+        # Keep only the top candidates by preference, so the re-rank below runs on those candidates only
+        if n_candidates is not None and n_candidates < len(scores):
+            top = EmbeddingIndex.top_k(scores, max(n_candidates, n_recommendations))
+            candidates, scores = candidates[top], scores[top]
+
+        # Normalize the preference ratings
+        MinPreference = scores.min()
+        MaxPreference = scores.max()
+        preference_range = MaxPreference - MinPreference
+        NormalizedPreferenceRating = (scores - MinPreference) / preference_range if preference_range > 0 else np.zeros_like(scores)
+
+        # Normalize the similarity penalty against the previous food
         MinSimilarity = 0
         MaxSimilarity = 1
+        if food_id < 0:
+            NormalizedSimilarityPenalty = 0
+        else:
+            # Look up the similarity of the previous food against all food items from the similarity store
+            SimilarityPenalty = self.similarity_store.row(food_id, food_features)[candidates]
+            NormalizedSimilarityPenalty = (SimilarityPenalty - MinSimilarity) / (MaxSimilarity - MinSimilarity)
+
+        # Calculate the average normalized nutrient score, with b from the bounds of the whole catalog
+        avg_nutrient_score = self.average_nutrient_scores(nutrient_table, candidates, nutritional_goal_left, a1, a2, MinPositiveScore)
 
+        # Get the time-based scores and normalize them
         MinTimeScore = 0
         MaxTimeScore = 1
+        NormalizedTimeScore = (nutrient_table.meal_time_scores(meal_time)[candidates] - MinTimeScore) / (MaxTimeScore - MinTimeScore)
 
-        final_dict = nutrient_data
-        for i, food_name in enumerate(food_names):
-            # Normalize the preference rating
-            PreferenceRating = scores[i]
-            NormalizedPreferenceRating = (PreferenceRating - MinPreference) / (MaxPreference - MinPreference)
+        # Calculate the final score for each food item
+        final_scores = w1 * NormalizedPreferenceRating - w2 * NormalizedSimilarityPenalty + w3 * avg_nutrient_score + w4 * NormalizedTimeScore
 
-            # Normalize the similarity penalty
-            if food_id < 0:
-                NormalizedSimilarityPenalty = 0
-            else:
-                SimilarityPenalty = similarities[food_id][i]
-                NormalizedSimilarityPenalty = (SimilarityPenalty - MinSimilarity) / (MaxSimilarity - MinSimilarity)
-
-            # Calculate and normalize nutrient scores for each nutrient
-            nutrient_scores = []
-            for nutrient in ['Calories', 'Fat', 'Carbs', 'Protein']:
-                total_nutrient = nutrient_data[food_name][nutrient]
-                nutrient_score = -a1 * (total_nutrient - nutritional_goal_left[nutrient])**2 + b_values[nutrient] if (nutritional_goal_left[nutrient] - total_nutrient) >= 0 else -a2 * (total_nutrient - nutritional_goal_left[nutrient])**2 + b_values[nutrient]
-                normalized_nutrient_score = (nutrient_score - MinNutrientScore[nutrient]) / (MaxNutrientScore[nutrient] - MinNutrientScore[nutrient])
-                nutrient_scores.append(normalized_nutrient_score)
-
-            # Calculate the average nutrient score
-            avg_nutrient_score = sum(nutrient_scores) / len(nutrient_scores)
-
-            # Get the time-based score and normalize it
-            TimeScore = nutrient_data[food_name][meal_time]
-            NormalizedTimeScore = (TimeScore - MinTimeScore) / (MaxTimeScore - MinTimeScore)
-
-            # Calculate the final score for each food item
-            score = w1 * NormalizedPreferenceRating - w2 * NormalizedSimilarityPenalty + w3 * avg_nutrient_score + w4 * NormalizedTimeScore
-
-            # Update the final_dict with the calculated score
-            final_dict[food_name]['score'] = score
-
-        # Get the top n recommendations based on the final scores
-        top_n = n_recommendations
-        top_n_food_data = self.top_n_items(final_dict, top_n)
-        print(top_n_food_data)
+        # Get the top n recommendations based on the final scores, re-ranked for diversity
+        picked = self.diversify(final_scores, candidates, food_features, n_recommendations, diversity, shortlist_size)
+        return candidates[picked], final_scores[picked]
+
+    def dynamic_food_recommend(self, model, interaction_matrix, user_id, user_features, food_id, food_names, food_features, nutrient_data, nutritional_goal_left, meal_time, n_recommendations=5, a1=0.001, a2=0.002, w1=0.3, w2=0.2, w3=0.3, w4=0.2, MinPositiveScore = 1, embedding_index=None, n_candidates=None, eligible_rows=None, diversity=0.0, shortlist_size=30):
+
+        # Get the nutrient table of the menus in the same order as the model items
+        if isinstance(nutrient_data, NutrientTable):
+            nutrient_table = nutrient_data
+        else:
+            nutrient_table = NutrientTable.from_dict(nutrient_data, food_names)
+
+        rows, final_scores = self.rank_food_rows(model, user_id, user_features, food_id, food_features, nutrient_table, nutritional_goal_left, meal_time, n_recommendations, a1, a2, w1, w2, w3, w4, MinPositiveScore,
+                                                 embedding_index=embedding_index, n_candidates=n_candidates, eligible_rows=eligible_rows, diversity=diversity, shortlist_size=shortlist_size)
+
+        # Top n recommendations by food name, as fresh read-only mappings owned by this call
+        top_n_food_data = {}
+        for index, final_score in zip(rows, final_scores):
+            food_data = nutrient_table.row(index)
+            food_data['score'] = float(final_score)
+            top_n_food_data[nutrient_table.food_names[index]] = food_data
         
-        return top_n_food_data
+        return MappingProxyType({food_name: MappingProxyType(food_data) for food_name, food_data in top_n_food_data.items()})
+
+    def get_embedding_index(self, model, db=None):
+        """Get the embedding index of the model for the current item features, building it if the model or menus changed.
+
+        Without a database session, e.g. when called on a model swap, a session is opened for the call.
+        """
+
+        if db is None:
+            db = database.SessionLocal()
+            try:
+                return self.get_embedding_index(model, db=db)
+            finally:
+                db.close()
+
+        self.feature_matrix.ensure_loaded(db=db)
+        item_features = self.feature_matrix.get_item_features()
+
+        embedding_index = self._embedding_index
+        if embedding_index is None or not embedding_index.is_built_for(model, item_features):
+            embedding_index = EmbeddingIndex(model, item_features)
+            self._embedding_index = embedding_index
+        return embedding_index
+
+    def get_candidate_index(self, db) -> CandidateIndex:
+        """Get the candidate index of the current item features, building it if the menus changed."""
+
+        self.feature_matrix.ensure_loaded(db=db)
+        item_features = self.feature_matrix.get_item_features()
+
+        candidate_index = self._candidate_index
+        if candidate_index is None or not candidate_index.is_built_for(item_features):
+            candidate_index = CandidateIndex(item_features)
+            self._candidate_index = candidate_index
+        return candidate_index
+
+    def recommend_menus_for_user(self, db, model, user_id: int, nutritional_goal_left: dict, meal_time: str, previous_menu_id: int = None, n_menus=5, dietary_constraints=None) -> list:
+        """Recommend menus for a user with the recommendation model.
+
+        Args:
+            db (Session): Database session of the request.
+            model (LightFM): Recommendation model, e.g. from the model holder.
+            user_id (int): ID of the user.
+            nutritional_goal_left (dict): Nutrients left to reach the daily goal.
+            meal_time (str): Meal time, i.e. "Breakfast", "Lunch" or "Dinner".
+            previous_menu_id (int): ID of the latest ordered menu, used for the similarity penalty.
+            n_menus (int): Number of menus to be recommended.
+            dietary_constraints (list): Names of DIETARY_CONSTRAINTS every recommended menu must satisfy, e.g. ["no_pork", "not_fried"].
+
+        Returns:
+            recommended_menus (tuple): Recommended menus in ranking order (MMR pick order when diversity > 0).
+        """
+
+        # Get the feature matrices, where menus are items in ascending menu ID
+        self.feature_matrix.ensure_loaded(db=db)
+        menu_ids = self.feature_matrix.menu_ids
+        user_index = self.feature_matrix.user_index(user_id, db=db)
+
+        # Get the nutrient table of the same menus from the menu catalog
+        menu_db = self.menu_catalog.menus(db)
+        nutrient_table = self.menu_catalog.nutrient_table(db, menu_ids)
+        food_id = menu_ids.index(previous_menu_id) if previous_menu_id in menu_ids else -1
+
+        embedding_index = self.get_embedding_index(model, db=db)
+        eligible_rows = self.get_candidate_index(db).eligible_rows(dietary_constraints)
+        rows, _ = self.rank_food_rows(model, user_index, self.feature_matrix.get_user_features(), food_id, self.feature_matrix.get_item_features(), nutrient_table, nutritional_goal_left, meal_time, n_recommendations=n_menus, embedding_index=embedding_index, n_candidates=self.n_candidates, eligible_rows=eligible_rows, diversity=self.diversity, shortlist_size=self.diversity_shortlist)
+
+        # Rows are in the menu order of the feature matrix, so menus are looked up by ID
+        recommended_menus = tuple(menu_db[menu_ids[row]] for row in rows)
+        return recommended_menus
+
+    def load_cold_start_prior(self):
+        """Build the cold-start prior of the current menus, e.g. at startup."""
+
+        db = database.SessionLocal()
+        try:
+            self.feature_matrix.ensure_loaded(db=db)
+            nutrient_table = self.menu_catalog.nutrient_table(db, self.feature_matrix.menu_ids)
+            self.cold_start_prior.load(db, self.feature_matrix, nutrient_table)
+        finally:
+            db.close()
+
+    def recommend_menus_for_new_user(self, db, user_id: int, nutritional_goal_left: dict, meal_time: str, n_menus=5, a1=0.001, a2=0.002, w1=0.3, w3=0.3, MinPositiveScore = 1, dietary_constraints=None) -> list:
+        """Recommend menus for a user without orders from the cold-start prior of the user's feature cluster.
+
+        The prior replaces the model preference and meal-time terms, so no model scoring or
+        interaction matrix is needed. The nutrition-goal score is applied as for other users.
+
+        Returns:
+            recommended_menus (tuple): Recommended menus in ranking order (MMR pick order when diversity > 0), or None if the user has no features.
+        """
+
+        self.feature_matrix.ensure_loaded(db=db)
+        user_index = self.feature_matrix.user_index(user_id, db=db)
+        if user_index is None:
+            return None
+
+        menu_ids = self.feature_matrix.menu_ids
+        menu_db = self.menu_catalog.menus(db)
+        nutrient_table = self.menu_catalog.nutrient_table(db, menu_ids)
+        prior = self.cold_start_prior.scores(db, self.feature_matrix, nutrient_table, self.feature_matrix.get_user_features()[user_index], meal_time)
+
+        eligible_rows = self.get_candidate_index(db).eligible_rows(dietary_constraints)
+        candidates = np.arange(len(menu_ids)) if eligible_rows is None else eligible_rows
+        if len(candidates) == 0:
+            return None
+
+        avg_nutrient_score = self.average_nutrient_scores(nutrient_table, candidates, nutritional_goal_left, a1, a2, MinPositiveScore)
+        final_scores = w1 * prior[candidates] + w3 * avg_nutrient_score
+
+        picked = self.diversify(final_scores, candidates, self.feature_matrix.get_item_features(), n_menus, self.diversity, self.diversity_shortlist)
+        recommended_menus = tuple(menu_db[menu_ids[candidates[index]]] for index in picked)
+        return recommended_menus
+
+    def recommend_menus_from_candidates(self, db, user_id: int, nutritional_goal_left: dict, meal_time: str, previous_menu_id: int = None, n_menus=5, a1=0.001, a2=0.002, w2=0.2, w3=0.3, MinPositiveScore = 1, dietary_constraints=None) -> list:
+        """Recommend menus for a user from the candidates precomputed by the recommendation job.
+
+        The precomputed score already contains the preference and meal-time terms, so only the
+        similarity penalty and the nutrition-goal score are applied to the candidates. Candidates
+        that do not satisfy the dietary constraints are dropped first.
+
+        Returns:
+            recommended_menus (tuple): Recommended menus in ranking order (MMR pick order when diversity > 0), or None if the user has no candidates.
+        """
+
+        candidates = recommendation_crud.get_recommendation_candidates(db, user_id=user_id, meal_time=meal_time)
+        if not candidates:
+            return None
+
+        menu_db = self.menu_catalog.menus(db)
+        nutrient_table = self.menu_catalog.nutrient_table(db)
+        candidates = [candidate for candidate in candidates if candidate.menu_id in menu_db]
+        candidate_menu_ids = np.array([candidate.menu_id for candidate in candidates], dtype=np.int64)
+        base_scores = np.array([candidate.score for candidate in candidates], dtype=np.float64)
+
+        # Rows of the candidates in the menu feature matrix, where candidates without menu features are -1
+        self.feature_matrix.ensure_loaded(db=db)
+        item_features = self.feature_matrix.get_item_features()
+        feature_menu_ids = np.asarray(self.feature_matrix.menu_ids, dtype=np.int64)
+        feature_rows = np.full(len(candidate_menu_ids), -1, dtype=np.int64)
+        if len(feature_menu_ids):
+            rows = np.minimum(np.searchsorted(feature_menu_ids, candidate_menu_ids), len(feature_menu_ids) - 1)
+            feature_rows = np.where(feature_menu_ids[rows] == candidate_menu_ids, rows, -1)
+
+        # Keep only the candidates with menu features that satisfy the dietary constraints
+        if dietary_constraints:
+            keep = (feature_rows >= 0) & self.get_candidate_index(db).mask(dietary_constraints)[np.maximum(feature_rows, 0)]
+            candidate_menu_ids, base_scores, feature_rows = candidate_menu_ids[keep], base_scores[keep], feature_rows[keep]
+            if len(candidate_menu_ids) == 0:
+                return None
+
+        # Nutrition-goal score of the candidates, with b from the bounds of the whole catalog
+        avg_nutrient_score = self.average_nutrient_scores(nutrient_table, nutrient_table.index_of(candidate_menu_ids), nutritional_goal_left, a1, a2, MinPositiveScore)
+
+        # Similarity penalty of the candidates against the previous food, where candidates without menu features get no penalty
+        SimilarityPenalty = 0
+        if previous_menu_id is not None and previous_menu_id in feature_menu_ids:
+            similarity = self.similarity_store.row(int(np.searchsorted(feature_menu_ids, previous_menu_id)), item_features)
+            SimilarityPenalty = np.where(feature_rows >= 0, similarity[np.maximum(feature_rows, 0)], 0.0)
+
+        final_scores = base_scores - w2 * SimilarityPenalty + w3 * avg_nutrient_score
+
+        recommended_menus = tuple(menu_db[int(candidate_menu_ids[index])] for index in self.diversify(final_scores, feature_rows, item_features, n_menus, self.diversity, self.diversity_shortlist))
+        return recommended_menus
+
+    def recommend_batch(self, db, model, requests: list, n_recommendations=5, chunk_size=256, a1=0.001, a2=0.002, w1=0.3, w2=0.2, w3=0.3, w4=0.2, MinPositiveScore = 1, diversity=0.0, shortlist_size=30) -> list:
+        """Recommend menus for many users at once.
+
+        The users x menus score matrix is computed with whole-array operations in chunks of
+        chunk_size users, which bounds the memory to a few chunk_size x menus arrays.
+
+        Args:
+            db (Session): Database session of the request.
+            model (LightFM): Recommendation model, e.g. from the model holder.
+            requests (list): Dictionaries with "user_id", "nutritional_goal_left", "meal_time" and optionally "previous_menu_id"
+                and "dietary_constraints".
+            n_recommendations (int): Number of menus to be recommended per user.
+            chunk_size (int): Number of users scored at once.
+            diversity (float): Weight of the diversity re-ranking of each user's shortlist, where 0 disables it.
+            shortlist_size (int): Number of top scored menus re-ranked for diversity.
+
+        Returns:
+            results (list): One dictionary per request with "user_id", "menu_ids" and "scores" in ranking order (MMR pick order when diversity > 0).
+                Users without features get no menus, and users get fewer menus if fewer menus satisfy their dietary constraints.
+        """
+
+        # Get the feature matrices and the nutrient table of the same menus, reading users created through other workers once
+        self.feature_matrix.ensure_loaded(db=db)
+        if any(self.feature_matrix.user_index(request["user_id"]) is None for request in requests):
+            self.feature_matrix.sync(db=db)
+        user_features = self.feature_matrix.get_user_features()
+        item_features = self.feature_matrix.get_item_features()
+        menu_ids = np.asarray(self.feature_matrix.menu_ids, dtype=np.int64)
+        nutrient_table = self.menu_catalog.nutrient_table(db, menu_ids)
+        embedding_index = self.get_embedding_index(model, db=db)
+        candidate_index = self.get_candidate_index(db)
+
+        results = [{"user_id": request["user_id"], "menu_ids": [], "scores": []} for request in requests]
+        known = [(position, self.feature_matrix.user_index(request["user_id"])) for position, request in enumerate(requests)]
+        known = [(position, user_index) for position, user_index in known if user_index is not None]
+        menu_rows = {menu_id: row for row, menu_id in enumerate(menu_ids.tolist())}
+
+        for start in range(0, len(known), chunk_size):
+            positions, user_indices = zip(*known[start:start + chunk_size])
+            chunk = [requests[position] for position in positions]
+
+            # Menus that satisfy the dietary constraints of each user
+            eligible = np.ones((len(chunk), len(menu_ids)), dtype=bool)
+            for row, request in enumerate(chunk):
+                if request.get("dietary_constraints"):
+                    eligible[row] = candidate_index.mask(request["dietary_constraints"])
+
+            # Score only the menus eligible for any user of the chunk, where the columns below are these menus
+            columns = np.flatnonzero(eligible.any(axis=0))
+            if len(columns) == 0:
+                continue
+            eligible = eligible[:, columns]
+
+            # Normalize the preference ratings of each user over the eligible menus
+            scores = embedding_index.score_users(np.asarray(user_indices), user_features, None if len(columns) == len(menu_ids) else columns)
+            MinPreference = np.where(eligible, scores, np.inf).min(axis=1, keepdims=True)
+            preference_range = np.where(eligible, scores, -np.inf).max(axis=1, keepdims=True) - MinPreference
+            preference_range[~np.isfinite(preference_range) | (preference_range == 0)] = 1
+            final_scores = w1 * (scores - np.where(np.isfinite(MinPreference), MinPreference, 0)) / preference_range
+
+            # Similarity penalty against the previous food of the users who have one
+            previous = [(row, menu_rows[request.get("previous_menu_id")]) for row, request in enumerate(chunk) if request.get("previous_menu_id") in menu_rows]
+            if previous:
+                rows, food_ids = map(list, zip(*previous))
+                final_scores[rows] -= w2 * self.similarity_store.rows(food_ids, item_features)[:, columns]
+
+            # Nutrient score of each user x menu, one nutrient at a time to bound memory
+            goal_left = np.array([[request["nutritional_goal_left"][nutrient] for nutrient in NUTRIENTS] for request in chunk], dtype=np.float64)
+            b_values = self.calculate_b(nutrient_table.nutrient_bounds, goal_left, a1, a2, MinPositiveScore)
+            nutrients = nutrient_table.nutrients[columns]
+            for column in range(len(NUTRIENTS)):
+                difference = nutrients[:, column] - goal_left[:, column, None]
+                nutrient_scores = -np.where(difference <= 0, a1, a2) * difference**2 + b_values[:, column, None]
+                final_scores += (w3 / len(NUTRIENTS)) * (nutrient_scores + b_values[:, column, None]) / (2 * b_values[:, column, None])
+
+            # Meal-time score of each user's meal time
+            meal_columns = [MEAL_TIMES.index(request["meal_time"]) for request in chunk]
+            final_scores += w4 * nutrient_table.meal_times[columns][:, meal_columns].T
+            final_scores[~eligible] = -np.inf
+
+            # Top n menus of each user sorted by score, or re-ranked for diversity for the whole chunk at once
+            n = min(n_recommendations, final_scores.shape[1])
+            if diversity > 0:
+                top = self.diversify_batch(final_scores, item_features, n, diversity, shortlist_size, item_rows=columns)
+                top_scores = np.take_along_axis(final_scores, top, axis=1)
+            else:
+                top = np.argpartition(-final_scores, n - 1, axis=1)[:, :n]
+                top_scores = np.take_along_axis(final_scores, top, axis=1)
+                order = np.argsort(-top_scores, axis=1, kind='stable')
+                top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+            for position, user_top, user_top_scores in zip(positions, top, top_scores):
+                found = np.isfinite(user_top_scores)
+                results[position]["menu_ids"] = menu_ids[columns[user_top[found]]].tolist()
+                results[position]["scores"] = user_top_scores[found].tolist()
 
+        return results
 
     # TODO: Replace random.sample() with a real recommendation algorithm
-    def recommend_menus(self, n_menus=5) -> list:
+    def recommend_menus(self, db, n_menus=5) -> list:
         """Recommend menus.
 
         Args:
+            db (Session): Database session of the request.
             n_menus (int): Number of menus to be recommended.
         
         Returns:
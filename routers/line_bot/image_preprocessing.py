@@ -0,0 +1,87 @@
+# Import general libraries
+import io
+import numpy as np
+from PIL import Image
+
+
+# Input size of both recognition models
+INPUT_SIZE = (224, 224)
+
+# ImageNet mean of the B, G and R channels subtracted by the caffe-style preprocessing of VGG-19
+VGG19_BGR_MEAN = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+
+def preprocess_vgg19(img_arr: np.ndarray) -> np.ndarray:
+    """Preprocess RGB pixels for VGG-19 like Keras' vgg19.preprocess_input, i.e. caffe style.
+
+    The channels are flipped to BGR and the ImageNet mean is subtracted in float32, so the result is
+    bit-identical to Keras. Unlike Keras, the result is a new contiguous array.
+    """
+
+    img_arr = img_arr[..., ::-1].astype(np.float32)
+    img_arr -= VGG19_BGR_MEAN
+    return img_arr
+
+
+def preprocess_inception_v3(img_arr: np.ndarray) -> np.ndarray:
+    """Preprocess RGB pixels for InceptionV3 like Keras' inception_v3.preprocess_input, i.e. scaled to [-1, 1] in float32."""
+
+    img_arr = img_arr.astype(np.float32)
+    img_arr /= 127.5
+    img_arr -= 1.0
+    return img_arr
+
+
+class PreparedImage:
+    """Photo decoded and resized once, from which the input tensors of both recognition models are made.
+
+    JPEG photos are decoded in draft mode, i.e. the decoder downscales by a power of two while
+    decoding to the smallest size that is still at least the input size, so a large phone photo
+    is never decoded at full resolution. The resized pixels are kept as one read-only uint8
+    array, and each model's tensor is made from it with one float32 allocation in NumPy.
+    """
+
+    def __init__(self, pixels: np.ndarray):
+        """Initialize the prepared image.
+
+        Args:
+            pixels (np.ndarray): Height x width x 3 RGB pixels of the resized image, as uint8.
+        """
+
+        self.pixels = pixels
+        self.pixels.setflags(write=False)
+        self._vgg19_input = None
+        self._inception_v3_input = None
+
+    @classmethod
+    def from_bytes(cls, img_byte, size: tuple = INPUT_SIZE):
+        """Decode and resize an image given as bytes or as a binary stream, which is read from the start."""
+
+        if isinstance(img_byte, (bytes, bytearray, memoryview)):
+            img_byte = io.BytesIO(img_byte)
+        elif img_byte.seekable():
+            img_byte.seek(0)
+
+        with Image.open(img_byte) as img_pil:
+            # Downscale while decoding, which only JPEG supports
+            img_pil.draft("RGB", size)
+            img_pil = img_pil.convert("RGB").resize(size)
+        return cls(np.asarray(img_pil, dtype=np.uint8))
+
+    def batch(self) -> np.ndarray:
+        """Get the pixels as a batch of one image without copying them."""
+        return self.pixels[np.newaxis]
+
+    def vgg19_input(self) -> np.ndarray:
+        """Get the input tensor of VGG-19, i.e. caffe-style BGR pixels minus the ImageNet mean."""
+
+        if self._vgg19_input is None:
+            self._vgg19_input = preprocess_vgg19(self.batch())
+        return self._vgg19_input
+
+    def inception_v3_input(self) -> np.ndarray:
+        """Get the input tensor of InceptionV3, i.e. pixels scaled to [-1, 1]."""
+
+        if self._inception_v3_input is None:
+            self._inception_v3_input = preprocess_inception_v3(self.batch())
+        return self._inception_v3_input
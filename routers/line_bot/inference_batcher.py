@@ -0,0 +1,146 @@
+# Import general libraries
+import time
+import queue
+import threading
+import numpy as np
+from concurrent.futures import Future
+
+
+class InferenceBatcher:
+    """Queue that merges the inputs of concurrent requests into batched runs of one Onnx model.
+
+    A worker thread takes the oldest input, then keeps collecting inputs until the batch holds
+    max_batch_size images or max_wait seconds have passed since the first one, runs the model
+    once on the concatenated batch and resolves the future of every caller with its own rows.
+    """
+
+    def __init__(self, model, max_batch_size: int = 8, max_wait: float = 0.005):
+        """Initialize the inference batcher.
+
+        Args:
+            model (OnnxModel): Model to run, whose first input dimension is the batch dimension.
+            max_batch_size (int): Largest number of images in one run.
+            max_wait (float): Longest time in seconds the first input of a batch waits for more inputs.
+        """
+
+        self.model = model
+        self.max_wait = max_wait
+
+        # A model exported with a fixed batch dimension cannot take larger batches
+        batch_dimension = model.input_shape[0] if len(model.input_shape) else None
+        if isinstance(batch_dimension, int) and batch_dimension > 0:
+            max_batch_size = min(max_batch_size, batch_dimension)
+        self.max_batch_size = max(1, max_batch_size)
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.requests = 0
+        self.completed_requests = 0
+        self.batches = 0
+        self.images = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = {}
+        self.total_queue_time = 0.0
+        self.total_run_time = 0.0
+
+    def __start(self):
+        # The worker is started by the first request, so it runs in the serving process after any fork
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.__work, name="inference-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, input_array: np.ndarray) -> Future:
+        """Queue a batch of one or more images and get the future of the model output rows of the batch."""
+
+        if self._thread is None:
+            self.__start()
+
+        future = Future()
+        self._queue.put((input_array, future, time.monotonic()))
+        queue_depth = self._queue.qsize()
+        with self._lock:
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+        return future
+
+    def run(self, input_array: np.ndarray) -> np.ndarray:
+        """Run the model on the input as part of a batch and wait for the output."""
+        return self.submit(input_array).result()
+
+    def stop(self):
+        """Stop the worker after the queued inputs are run."""
+
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def __collect(self, first) -> list:
+        batch = [first]
+        n_images = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while n_images < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the stop marker back for the worker loop
+                self._queue.put(None)
+                break
+            batch.append(item)
+            n_images += len(item[0])
+        return batch
+
+    def __work(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            batch = self.__collect(first)
+            start = time.monotonic()
+            try:
+                input_array = batch[0][0] if len(batch) == 1 else np.concatenate([item[0] for item in batch])
+                output_array = self.model.run(input_array)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            run_time = time.monotonic() - start
+
+            # Split the output rows back into the batches of the callers
+            offset = 0
+            for item_input, future, _ in batch:
+                future.set_result(output_array[offset:offset + len(item_input)])
+                offset += len(item_input)
+
+            with self._lock:
+                self.completed_requests += len(batch)
+                self.batches += 1
+                self.images += offset
+                self.batch_sizes[offset] = self.batch_sizes.get(offset, 0) + 1
+                self.total_queue_time += sum(start - queued_at for _, _, queued_at in batch)
+                self.total_run_time += run_time
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait": self.max_wait,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "batches": self.batches,
+                "images": self.images,
+                "mean_batch_size": self.images / self.batches if self.batches else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "mean_queue_time": self.total_queue_time / self.completed_requests if self.completed_requests else 0.0,
+                "mean_run_time": self.total_run_time / self.batches if self.batches else 0.0
+            }
@@ -0,0 +1,58 @@
+# Import general libraries
+from collections import namedtuple
+import numpy as np
+
+# Import libraries for recommendation
+from scipy.sparse import coo_matrix
+
+# Import database
+import routers.order.crud as order_crud
+
+
+# Users x menus interaction matrix with the user and menu IDs of its rows and columns
+InteractionMatrix = namedtuple("InteractionMatrix", ["matrix", "user_ids", "menu_ids"])
+
+
+def build_interaction_matrix(db, user_ids=None, menu_ids=None, since_order_id: int = 0, until_order_id: int = None,
+                             missing_rating: float = 0.0, chunk_size: int = 10000) -> InteractionMatrix:
+    """Build the users x menus matrix of the mean rating of each user and menu.
+
+    The mean is aggregated in SQL and streamed in chunks, so memory and time scale with the number
+    of distinct (user, menu) pairs.
+
+    Args:
+        db (Session): Database session.
+        user_ids (list): User IDs of the rows in ascending order, e.g. FeatureMatrixService.user_ids.
+            Defaults to the users with orders. Orders of other users are skipped.
+        menu_ids (list): Menu IDs of the columns in ascending order. Defaults to the menus with orders.
+        since_order_id (int): Only aggregate orders with a greater ID, e.g. for interaction deltas.
+        until_order_id (int): Only aggregate orders with a smaller or equal ID.
+        missing_rating (float): Rating of pairs whose orders are all unrated. The default 0.0 is no interaction.
+        chunk_size (int): Number of rows fetched at once.
+
+    Returns:
+        interaction_matrix (InteractionMatrix): COO matrix with its user and menu IDs.
+    """
+
+    user_chunks, menu_chunks, rating_chunks = [], [], []
+    for rows in order_crud.stream_interaction_ratings(db, since_order_id=since_order_id, until_order_id=until_order_id, missing_rating=missing_rating, chunk_size=chunk_size):
+        user_column, menu_column, rating_column = zip(*rows)
+        user_chunks.append(np.fromiter(user_column, dtype=np.int64, count=len(rows)))
+        menu_chunks.append(np.fromiter(menu_column, dtype=np.int64, count=len(rows)))
+        rating_chunks.append(np.fromiter(rating_column, dtype=np.float32, count=len(rows)))
+
+    pair_users = np.concatenate(user_chunks) if user_chunks else np.zeros(0, dtype=np.int64)
+    pair_menus = np.concatenate(menu_chunks) if menu_chunks else np.zeros(0, dtype=np.int64)
+    ratings = np.concatenate(rating_chunks) if rating_chunks else np.zeros(0, dtype=np.float32)
+
+    user_ids = np.unique(pair_users) if user_ids is None else np.asarray(user_ids, dtype=np.int64)
+    menu_ids = np.unique(pair_menus) if menu_ids is None else np.asarray(menu_ids, dtype=np.int64)
+
+    # Map the IDs to rows and columns, and drop pairs of unknown users or menus
+    rows = np.searchsorted(user_ids, pair_users)
+    cols = np.searchsorted(menu_ids, pair_menus)
+    known = (rows < len(user_ids)) & (cols < len(menu_ids))
+    known[known] &= (user_ids[rows[known]] == pair_users[known]) & (menu_ids[cols[known]] == pair_menus[known])
+
+    matrix = coo_matrix((ratings[known], (rows[known], cols[known])), shape=(len(user_ids), len(menu_ids)))
+    return InteractionMatrix(matrix, user_ids, menu_ids)
@@ -0,0 +1,178 @@
+# Import general libraries
+import threading
+import numpy as np
+
+# Import database
+import routers.menu.crud as menu_crud
+
+
+# Nutrients used by the nutrition-goal score, in column order of NutrientTable.nutrients
+NUTRIENTS = ['Calories', 'Fat', 'Carbs', 'Protein']
+
+# Meal times returned by get_meal(), in column order of NutrientTable.meal_times
+MEAL_TIMES = ['Breakfast', 'Lunch', 'Dinner']
+
+# Percentiles kept in the nutrient statistics
+NUTRIENT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def _readonly(array, dtype) -> np.ndarray:
+    """Copy an array and make it read-only, so tables shared by concurrent requests cannot be modified."""
+
+    array = np.array(array, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+
+class NutrientTable:
+    """Menus x nutrients array view of the nutrient data used for recommendation.
+
+    Row i of every array belongs to food_names[i], which is the same order as the item
+    index of the recommendation model. Tables of the menu catalog also know the menu ID of each row.
+
+    The column-wise nutrient statistics are computed once when the table is built, so they are
+    recomputed only when the menus change.
+    """
+
+    def __init__(self, food_names: list, nutrients: np.ndarray, meal_times: np.ndarray, records: list = None, menu_ids: np.ndarray = None, nutrient_stats: dict = None):
+        self.food_names = list(food_names)
+        self.nutrients = _readonly(nutrients, np.float64)
+        self.meal_times = _readonly(meal_times, np.float64)
+        self.records = records
+        self.menu_ids = None if menu_ids is None else _readonly(menu_ids, np.int64)
+        self.nutrient_stats = nutrient_stats if nutrient_stats is not None else self.__compute_nutrient_stats(self.nutrients)
+
+    @staticmethod
+    def __compute_nutrient_stats(nutrients: np.ndarray) -> dict:
+        if len(nutrients) == 0:
+            empty = np.full(len(NUTRIENTS), np.nan)
+            return {"min": empty, "max": empty, "percentiles": {q: empty for q in NUTRIENT_PERCENTILES}}
+
+        percentiles = np.percentile(nutrients, NUTRIENT_PERCENTILES, axis=0)
+        return {
+            "min": nutrients.min(axis=0),
+            "max": nutrients.max(axis=0),
+            "percentiles": dict(zip(NUTRIENT_PERCENTILES, percentiles))
+        }
+
+    @property
+    def nutrient_bounds(self) -> tuple:
+        """Get the min and max of each nutrient column."""
+        return self.nutrient_stats["min"], self.nutrient_stats["max"]
+
+    @classmethod
+    def from_dict(cls, nutrient_data: dict, food_names: list = None):
+        """Build a table from a {food_name: {nutrient: value}} dictionary.
+
+        Args:
+            nutrient_data (dict): Nutrient data, e.g. the output of menu_crud.get_menus_for_recommendation.
+            food_names (list): Order of the rows. Defaults to the order of the dictionary.
+
+        Returns:
+            table (NutrientTable): Nutrient table of the menus.
+        """
+
+        if food_names is None:
+            food_names = list(nutrient_data)
+
+        records = [nutrient_data[food_name] for food_name in food_names]
+        nutrients = np.array([[record[nutrient] for nutrient in NUTRIENTS] for record in records], dtype=np.float64).reshape(-1, len(NUTRIENTS))
+        meal_times = np.array([[record[meal_time] for meal_time in MEAL_TIMES] for record in records], dtype=np.float64).reshape(-1, len(MEAL_TIMES))
+
+        return cls(food_names, nutrients, meal_times, records=records)
+
+    @classmethod
+    def from_menus(cls, menus: list):
+        """Build a table from Menu models, e.g. the values of menu_crud.get_menus."""
+
+        nutrients = np.array([[menu.calorie, menu.fat, menu.carbohydrate, menu.protein] for menu in menus], dtype=np.float64).reshape(-1, len(NUTRIENTS))
+        meal_times = np.array([[menu.breakfast or 0.0, menu.lunch or 0.0, menu.dinner or 0.0] for menu in menus], dtype=np.float64).reshape(-1, len(MEAL_TIMES))
+
+        return cls([menu.name for menu in menus], nutrients, meal_times, menu_ids=[menu.id for menu in menus])
+
+    def __len__(self):
+        return len(self.food_names)
+
+    def take(self, indices) -> 'NutrientTable':
+        """Get a table of the given rows, which keeps the nutrient statistics of this table."""
+
+        indices = np.asarray(indices, dtype=np.int64)
+        return NutrientTable(
+            [self.food_names[index] for index in indices],
+            self.nutrients[indices],
+            self.meal_times[indices],
+            records=None if self.records is None else [self.records[index] for index in indices],
+            menu_ids=None if self.menu_ids is None else self.menu_ids[indices],
+            nutrient_stats=self.nutrient_stats
+        )
+
+    def index_of(self, menu_ids) -> np.ndarray:
+        """Get the rows of the given menu IDs. The table rows must be in ascending menu ID."""
+
+        menu_ids = np.asarray(menu_ids, dtype=np.int64)
+        indices = np.searchsorted(self.menu_ids, menu_ids)
+        if len(indices) and (indices.max() >= len(self.menu_ids) or np.any(self.menu_ids[indices] != menu_ids)):
+            raise KeyError("Menu ID not found in the nutrient table.")
+        return indices
+
+    def meal_time_scores(self, meal_time: str) -> np.ndarray:
+        """Get the meal-time score column of every menu."""
+        return self.meal_times[:, MEAL_TIMES.index(meal_time)]
+
+    def row(self, index: int) -> dict:
+        """Get a fresh dictionary of nutrient values of the menu at the given row."""
+
+        if self.records is not None:
+            return dict(self.records[index])
+
+        row = dict(zip(NUTRIENTS, self.nutrients[index].tolist()))
+        row.update(zip(MEAL_TIMES, self.meal_times[index].tolist()))
+        return row
+
+
+class MenuCatalog:
+    """Menus and their nutrient table, loaded once and reloaded on the first read after the menus change."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stale = True
+        self._menus = {}
+        self._nutrient_table = NutrientTable([], np.zeros((0, len(NUTRIENTS))), np.zeros((0, len(MEAL_TIMES))), menu_ids=[])
+
+    def invalidate(self, **kwargs):
+        """Mark the catalog stale. Connected to the menu change signal."""
+        self._stale = True
+
+    def refresh(self, db):
+        with self._lock:
+            if not self._stale:
+                return
+            self._stale = False
+            try:
+                menus = menu_crud.get_menus(db, limit=None)
+                menu_ids = sorted(menus)
+                nutrient_table = NutrientTable.from_menus([menus[menu_id] for menu_id in menu_ids])
+            except Exception:
+                self._stale = True
+                raise
+
+            self._menus, self._nutrient_table = menus, nutrient_table
+
+    def menus(self, db) -> dict:
+        """Get the menus by menu ID."""
+        self.refresh(db)
+        return self._menus
+
+    def nutrient_stats(self, db) -> dict:
+        """Get the min, max and percentiles of each nutrient over all menus."""
+        self.refresh(db)
+        return self._nutrient_table.nutrient_stats
+
+    def nutrient_table(self, db, menu_ids=None) -> NutrientTable:
+        """Get the nutrient table of all menus in ascending menu ID, or of the given menus in the given order."""
+
+        self.refresh(db)
+        nutrient_table = self._nutrient_table
+        if menu_ids is None:
+            return nutrient_table
+        return nutrient_table.take(nutrient_table.index_of(menu_ids))
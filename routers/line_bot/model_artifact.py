@@ -0,0 +1,158 @@
+# Import general libraries
+import os
+import json
+import shutil
+import pickle
+import argparse
+from datetime import datetime
+import numpy as np
+
+# Import libraries for recommendation
+from scipy.sparse import csr_matrix, identity
+
+
+# Artifact format written by export_model
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+# Model arrays of the artifact, stored as float32
+MODEL_ARRAYS = ["user_embeddings", "user_biases", "item_embeddings", "item_biases"]
+
+# Optional index mappings of the feature matrix rows, stored as int64
+INDEX_ARRAYS = ["user_ids", "menu_ids"]
+
+
+def read_manifest(artifact_dir: str) -> dict:
+    manifest_path = os.path.join(artifact_dir, MANIFEST_NAME)
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path) as fle:
+        return json.load(fle)
+
+
+def export_model(model, artifact_dir: str, user_ids=None, menu_ids=None) -> str:
+    """Export the embeddings and biases of a LightFM model as .npy arrays with a JSON manifest.
+
+    Each export writes a new version directory and then replaces the manifest, so workers that
+    still map the arrays of the previous version keep reading valid files.
+
+    Args:
+        model (LightFM): Fitted recommendation model.
+        artifact_dir (str): Directory of the artifact.
+        user_ids (list): User IDs of the user feature matrix rows the model was fitted on.
+        menu_ids (list): Menu IDs of the item feature matrix rows the model was fitted on.
+
+    Returns:
+        manifest_path (str): Path of the new manifest.
+    """
+
+    version = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    version_dir = os.path.join(artifact_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    arrays = {name: np.ascontiguousarray(getattr(model, name), dtype=np.float32) for name in MODEL_ARRAYS}
+    for name, ids in zip(INDEX_ARRAYS, (user_ids, menu_ids)):
+        if ids is not None:
+            arrays[name] = np.asarray(ids, dtype=np.int64)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "created_at": datetime.now().isoformat(),
+        "no_components": int(arrays["user_embeddings"].shape[1]),
+        "loss": getattr(model, "loss", None),
+        "arrays": {}
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(version_dir, f"{name}.npy"), array)
+        manifest["arrays"][name] = {"file": f"{version}/{name}.npy", "shape": list(array.shape), "dtype": str(array.dtype)}
+
+    previous_manifest = read_manifest(artifact_dir)
+
+    manifest_path = os.path.join(artifact_dir, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as fle:
+        json.dump(manifest, fle, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+    # Remove the versions before the previous one. Mapped files of removed versions stay readable until unmapped.
+    if previous_manifest is not None:
+        for name in os.listdir(artifact_dir):
+            if name < previous_manifest["version"] and name != MANIFEST_NAME and os.path.isdir(os.path.join(artifact_dir, name)):
+                shutil.rmtree(os.path.join(artifact_dir, name), ignore_errors=True)
+
+    return manifest_path
+
+
+class MappedModel:
+    """Read-only LightFM model backed by memory-mapped arrays.
+
+    All workers on a host map the same files, so they share one page-cache copy of the model.
+    It has the attributes and the representation and predict methods of LightFM used for
+    serving, but it cannot be trained.
+    """
+
+    def __init__(self, manifest_path: str):
+        with open(manifest_path) as fle:
+            manifest = json.load(fle)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f'Unsupported model artifact format: {manifest.get("format_version")}')
+
+        artifact_dir = os.path.dirname(manifest_path)
+        self.manifest = manifest
+        self.version = manifest["version"]
+        self.no_components = manifest["no_components"]
+        self.loss = manifest.get("loss")
+
+        for name in MODEL_ARRAYS + INDEX_ARRAYS:
+            array = None
+            if name in manifest["arrays"]:
+                array = np.load(os.path.join(artifact_dir, manifest["arrays"][name]["file"]), mmap_mode='r')
+                if list(array.shape) != manifest["arrays"][name]["shape"]:
+                    raise ValueError(f'Array "{name}" of the model artifact has shape {array.shape}, expected {manifest["arrays"][name]["shape"]}')
+            setattr(self, name, array)
+
+    @staticmethod
+    def __representations(features, biases, embeddings) -> tuple:
+        if features is None:
+            features = identity(len(biases), dtype=np.float32, format='csr')
+        features = csr_matrix(features, dtype=np.float32)
+        return np.asarray(features @ biases, dtype=np.float32).ravel(), np.asarray(features @ embeddings, dtype=np.float32)
+
+    def get_user_representations(self, features=None) -> tuple:
+        return self.__representations(features, self.user_biases, self.user_embeddings)
+
+    def get_item_representations(self, features=None) -> tuple:
+        return self.__representations(features, self.item_biases, self.item_embeddings)
+
+    def predict(self, user_ids, item_ids, item_features=None, user_features=None, num_threads=1) -> np.ndarray:
+        """Compute the scores of user and item pairs like LightFM.predict, where a single user ID is used for all items."""
+
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        user_ids = np.broadcast_to(np.asarray(user_ids, dtype=np.int64), item_ids.shape)
+
+        # Project only the feature rows of the requested users and items
+        unique_users, user_rows = np.unique(user_ids, return_inverse=True)
+        unique_items, item_rows = np.unique(item_ids, return_inverse=True)
+        user_features = identity(len(self.user_biases), dtype=np.float32, format='csr') if user_features is None else csr_matrix(user_features)
+        item_features = identity(len(self.item_biases), dtype=np.float32, format='csr') if item_features is None else csr_matrix(item_features)
+        user_biases, user_embeddings = self.get_user_representations(user_features[unique_users])
+        item_biases, item_embeddings = self.get_item_representations(item_features[unique_items])
+
+        scores = np.einsum('ij,ij->i', user_embeddings[user_rows], item_embeddings[item_rows])
+        return (scores + user_biases[user_rows] + item_biases[item_rows]).astype(np.float32)
+
+
+def load_model(manifest_path: str) -> MappedModel:
+    return MappedModel(manifest_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export a pickled LightFM model as a memory-mappable artifact.")
+    parser.add_argument("--model-path", default="assets/models/rec_model.pickle", help="Path of the pickled model.")
+    parser.add_argument("--artifact-dir", default="assets/models/rec_model", help="Directory of the artifact.")
+    args = parser.parse_args()
+
+    with open(args.model_path, 'rb') as fle:
+        model = pickle.load(fle)
+    print(f'Exported model artifact to "{export_model(model, args.artifact_dir)}".')
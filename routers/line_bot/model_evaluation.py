@@ -0,0 +1,195 @@
+# Import general libraries
+import os
+import json
+import time
+import argparse
+import itertools
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+# Import LightFM and other libraries for recommendation
+from lightfm import LightFM
+from lightfm.evaluation import precision_at_k, recall_at_k, auc_score
+from scipy.sparse import coo_matrix
+
+# Import database
+import database
+import routers.order.crud as order_crud
+from routers.line_bot.feature_matrix import FeatureMatrixService
+from routers.line_bot.interaction_matrix import build_interaction_matrix
+from routers.line_bot.embedding_index import EmbeddingIndex
+
+
+# Default hyperparameter grid of the sweep
+SWEEP_GRID = {
+    "no_components": [16, 32, 64],
+    "loss": ["warp", "bpr", "logistic"],
+    "epochs": [10, 30, 50]
+}
+
+
+class ModelEvaluator:
+    """Evaluate LightFM hyperparameters on a time-based split of the orders table.
+
+    The oldest orders are the train set and the newest orders are the test set, so the metrics
+    measure how well a model trained on the past predicts the next orders. Each evaluation also
+    reports the latency of scoring all menus for a user, so quality and speed can be compared.
+    """
+
+    def __init__(self, k=5, test_fraction=0.2, num_threads=None, exclude_train=False, latency_users=100, n_recommendations=5, random_state=0):
+        self.k = k
+        self.test_fraction = test_fraction
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.exclude_train = exclude_train
+        self.latency_users = latency_users
+        self.n_recommendations = n_recommendations
+        self.random_state = random_state
+
+    def load_split(self) -> dict:
+        """Load the feature matrices and the train and test interactions from the database."""
+
+        db = database.SessionLocal()
+        try:
+            feature_matrix = FeatureMatrixService()
+            feature_matrix.load(db=db)
+
+            # Orders are split by ID, the same key as the training checkpoints, which follows creation order
+            split_order_id = order_crud.get_split_order_id(db=db, train_fraction=1 - self.test_fraction)
+            last_order_id = order_crud.get_last_order_id(db=db)
+
+            def interactions(since_order_id, until_order_id):
+                return build_interaction_matrix(db, user_ids=feature_matrix.user_ids, menu_ids=feature_matrix.menu_ids,
+                                                since_order_id=since_order_id, until_order_id=until_order_id, missing_rating=1.0).matrix.tocsr()
+
+            train = interactions(0, split_order_id)
+            test = interactions(split_order_id, last_order_id)
+        finally:
+            db.close()
+
+        if self.exclude_train:
+            # Only count menus the user has not ordered before as hits
+            test = test - test.multiply(train.astype(bool))
+            test.eliminate_zeros()
+
+        return {
+            "train": coo_matrix(train),
+            "test": coo_matrix(test),
+            "user_features": feature_matrix.get_user_features(),
+            "item_features": feature_matrix.get_item_features(),
+            "split_order_id": split_order_id,
+            "last_order_id": last_order_id
+        }
+
+    def latency(self, model, split: dict) -> dict:
+        """Time scoring all menus and taking the top menus for a sample of users, as the serving path does."""
+
+        user_features = split["user_features"]
+        embedding_index = EmbeddingIndex(model, split["item_features"])
+        rng = np.random.default_rng(self.random_state)
+
+        durations = []
+        for user_index in rng.choice(user_features.shape[0], size=min(self.latency_users, user_features.shape[0]), replace=False):
+            start = time.perf_counter()
+            scores = embedding_index.score(int(user_index), user_features)
+            EmbeddingIndex.top_k(scores, self.n_recommendations)
+            durations.append(time.perf_counter() - start)
+
+        durations_ms = np.asarray(durations) * 1000
+        return {
+            "latency_p50_ms": float(np.percentile(durations_ms, 50)) if len(durations_ms) else None,
+            "latency_p95_ms": float(np.percentile(durations_ms, 95)) if len(durations_ms) else None
+        }
+
+    def evaluate(self, split: dict, no_components=32, loss='warp', epochs=30, num_threads=None) -> dict:
+        """Fit a model with the given hyperparameters on the train set and evaluate it on the test set."""
+
+        num_threads = num_threads or self.num_threads
+        train, test = split["train"], split["test"]
+        user_features, item_features = split["user_features"], split["item_features"]
+        train_interactions = train if self.exclude_train else None
+
+        model = LightFM(no_components=no_components, loss=loss, random_state=self.random_state)
+        start = time.perf_counter()
+        model.fit(train, user_features=user_features, item_features=item_features, epochs=epochs, num_threads=num_threads)
+        fit_seconds = time.perf_counter() - start
+
+        metrics = {
+            "precision_at_k": precision_at_k(model, test, train_interactions=train_interactions, k=self.k, user_features=user_features, item_features=item_features, num_threads=num_threads),
+            "recall_at_k": recall_at_k(model, test, train_interactions=train_interactions, k=self.k, user_features=user_features, item_features=item_features, num_threads=num_threads),
+            "auc": auc_score(model, test, train_interactions=train_interactions, user_features=user_features, item_features=item_features, num_threads=num_threads)
+        }
+
+        result = {"no_components": no_components, "loss": loss, "epochs": epochs, "k": self.k, "fit_seconds": fit_seconds}
+        result.update({name: float(np.mean(values)) if len(values) else None for name, values in metrics.items()})
+        result.update(self.latency(model, split))
+        return result
+
+    def sweep(self, split: dict, grid: dict = None, max_workers=None, sort_by="precision_at_k") -> list:
+        """Evaluate every combination of the grid in a process pool and rank them by the given metric.
+
+        Each process fits one model at a time with one thread, so all cores are used without
+        oversubscribing them.
+        """
+
+        grid = grid or SWEEP_GRID
+        combinations = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+        leaderboard = []
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=_init_worker, initargs=(self, split)) as executor:
+            futures = [executor.submit(_evaluate_worker, params) for params in combinations]
+            for future in as_completed(futures):
+                result = future.result()
+                leaderboard.append(result)
+                print(f'{len(leaderboard)}/{len(combinations)} {result}')
+
+        leaderboard.sort(key=lambda result: result[sort_by] if result[sort_by] is not None else float("-inf"), reverse=True)
+        for rank, result in enumerate(leaderboard, start=1):
+            result["rank"] = rank
+        return leaderboard
+
+
+# Evaluator and split of a sweep worker process, sent once per process instead of once per task
+_worker_state = {}
+
+def _init_worker(evaluator: ModelEvaluator, split: dict):
+    _worker_state["evaluator"] = evaluator
+    _worker_state["split"] = split
+
+def _evaluate_worker(params: dict) -> dict:
+    return _worker_state["evaluator"].evaluate(_worker_state["split"], num_threads=1, **params)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate the recommendation model on a time-based split of the orders.")
+    parser.add_argument("--sweep", action="store_true", help="Run the hyperparameter sweep instead of a single evaluation.")
+    parser.add_argument("--no-components", type=int, nargs="+", default=None, help="Embedding sizes to evaluate.")
+    parser.add_argument("--loss", nargs="+", default=None, help="Losses to evaluate, e.g. warp, bpr, logistic or warp-kos.")
+    parser.add_argument("--epochs", type=int, nargs="+", default=None, help="Epochs to evaluate.")
+    parser.add_argument("--k", type=int, default=5, help="Number of recommendations of precision@k and recall@k.")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="Fraction of the newest orders used as the test set.")
+    parser.add_argument("--exclude-train", action="store_true", help="Only count menus not ordered in the train set as hits.")
+    parser.add_argument("--num-threads", type=int, default=None, help="Number of threads of a single evaluation.")
+    parser.add_argument("--max-workers", type=int, default=None, help="Number of processes of the sweep.")
+    parser.add_argument("--output", default="assets/models/leaderboard.json", help="Path of the sweep leaderboard.")
+    args = parser.parse_args()
+
+    evaluator = ModelEvaluator(k=args.k, test_fraction=args.test_fraction, num_threads=args.num_threads, exclude_train=args.exclude_train)
+    split = evaluator.load_split()
+    print(f'Train orders up to ID {split["split_order_id"]}: {split["train"].nnz} interactions, test orders up to ID {split["last_order_id"]}: {split["test"].nnz} interactions.')
+
+    if args.sweep:
+        grid = {
+            "no_components": args.no_components or SWEEP_GRID["no_components"],
+            "loss": args.loss or SWEEP_GRID["loss"],
+            "epochs": args.epochs or SWEEP_GRID["epochs"]
+        }
+        leaderboard = evaluator.sweep(split, grid, max_workers=args.max_workers)
+
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as fle:
+            json.dump({"created_at": datetime.now().isoformat(), "test_fraction": args.test_fraction, "exclude_train": args.exclude_train, "leaderboard": leaderboard}, fle, indent=2)
+        print(f'Saved the leaderboard of {len(leaderboard)} runs to {args.output}')
+    else:
+        result = evaluator.evaluate(split, no_components=(args.no_components or [32])[0], loss=(args.loss or ['warp'])[0], epochs=(args.epochs or [30])[0])
+        print(json.dumps(result, indent=2))
@@ -0,0 +1,90 @@
+# Import general libraries
+import os
+import threading
+
+
+class ModelHolder:
+    """Process-wide holder of a model artifact that is hot-swapped when the artifact file changes.
+
+    Request handlers call get() once and keep the returned reference for the whole request, so a
+    swap never affects a request in flight. A background thread watches the artifact and loads a
+    new model while the current one keeps serving, then publishes it with a single reference assignment.
+    """
+
+    def __init__(self, model_path: str, loader, check_interval: float = 30.0):
+        """Initialize the model holder.
+
+        Args:
+            model_path (str): Path of the model artifact to watch.
+            loader (callable): Function that loads the model from a path.
+            check_interval (float): Number of seconds between two checks of the artifact.
+        """
+
+        self.model_path = model_path
+        self.loader = loader
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._model = None
+        self._signature = None
+        self._swap_callbacks = []
+        self._watcher = None
+        self._stop_event = threading.Event()
+
+    def __artifact_signature(self):
+        try:
+            stat = os.stat(self.model_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def on_swap(self, callback):
+        """Register a callback that is called with every newly loaded model."""
+        self._swap_callbacks.append(callback)
+        return callback
+
+    def load(self) -> bool:
+        """Load the artifact if it changed since the last load. Returns True if a new model was swapped in."""
+
+        with self._lock:
+            signature = self.__artifact_signature()
+            if signature is None or signature == self._signature:
+                return False
+
+            # Only one thread loads at a time, requests keep using the current model meanwhile
+            try:
+                model = self.loader(self.model_path)
+            except Exception as e:
+                print(f'Could not load model artifact "{self.model_path}": {e}')
+                return False
+
+            # Precompute derived state of the new model before it becomes visible to requests
+            for callback in self._swap_callbacks:
+                try:
+                    callback(model)
+                except Exception as e:
+                    print(f'Swap callback of "{self.model_path}" failed: {e}')
+
+            self._model = model
+            self._signature = signature
+            print(f'Loaded model artifact "{self.model_path}".')
+            return True
+
+    def get(self):
+        """Get the current model without copying it, or None if no artifact has been loaded."""
+        return self._model
+
+    def __watch(self):
+        while not self._stop_event.wait(self.check_interval):
+            self.load()
+
+    def start_watching(self):
+        """Start a daemon thread that swaps in a new model whenever the artifact changes."""
+
+        if self._watcher is None or not self._watcher.is_alive():
+            self._stop_event.clear()
+            self._watcher = threading.Thread(target=self.__watch, name="model-holder-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop_watching(self):
+        self._stop_event.set()
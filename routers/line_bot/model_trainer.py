@@ -0,0 +1,165 @@
+# Import general libraries
+import os
+import json
+import argparse
+from datetime import datetime
+
+# Import LightFM and other libraries for recommendation
+from lightfm import LightFM
+from lightfm.evaluation import precision_at_k
+from scipy.sparse import coo_matrix
+
+# Import database
+import database
+import routers.order.crud as order_crud
+from routers.line_bot.feature_matrix import FeatureMatrixService
+from routers.line_bot.interaction_matrix import build_interaction_matrix
+from routers.line_bot.food_recommendation import FoodRecommendation
+
+
+class ModelTrainer:
+    """Retrain the recommendation model from the orders table.
+
+    Each run reads only the orders created since the last checkpoint and updates the published
+    model with fit_partial. Every full_refit_every runs, a new model is fitted on all orders and
+    published only if it is not worse than the current model on the orders the current model has
+    not seen yet, i.e. the orders after the checkpoint. For a fair comparison, the candidate of the
+    check is fitted on the same orders as the current model, i.e. the orders up to the checkpoint.
+    """
+
+    def __init__(self, food_recommendation: FoodRecommendation, checkpoint_path: str = "assets/models/rec_model_checkpoint.json",
+                 no_components=32, loss='warp', epochs=30, incremental_epochs=5, full_refit_every=24,
+                 num_threads=None, k=5, tolerance=0.0):
+        self.food_recommendation = food_recommendation
+        self.checkpoint_path = checkpoint_path
+        self.no_components = no_components
+        self.loss = loss
+        self.epochs = epochs
+        self.incremental_epochs = incremental_epochs
+        self.full_refit_every = full_refit_every
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.k = k
+        self.tolerance = tolerance
+
+    def load_checkpoint(self) -> dict:
+        if not os.path.isfile(self.checkpoint_path):
+            return {"last_order_id": 0, "runs_since_full_refit": 0}
+        with open(self.checkpoint_path) as fle:
+            return json.load(fle)
+
+    def save_checkpoint(self, checkpoint: dict):
+        checkpoint["updated_at"] = datetime.now().isoformat()
+        tmp_path = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as fle:
+            json.dump(checkpoint, fle)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def build_interactions(self, db, feature_matrix: FeatureMatrixService, since_order_id: int, until_order_id: int) -> coo_matrix:
+        """Build the users x menus matrix of the mean rating of the orders in the given ID range, where unrated orders count as 1."""
+
+        return build_interaction_matrix(db, user_ids=feature_matrix.user_ids, menu_ids=feature_matrix.menu_ids,
+                                        since_order_id=since_order_id, until_order_id=until_order_id, missing_rating=1.0).matrix
+
+    def __is_compatible(self, model, user_features, item_features) -> bool:
+        return model.user_embeddings.shape[0] == user_features.shape[1] and model.item_embeddings.shape[0] == item_features.shape[1]
+
+    def __new_model(self):
+        return LightFM(loss=self.loss, no_components=self.no_components)
+
+    def __precision(self, model, test, train, user_features, item_features) -> float:
+        return float(precision_at_k(model, test, train_interactions=train, k=self.k, user_features=user_features, item_features=item_features, num_threads=self.num_threads).mean())
+
+    def full_refit(self, current_model, interactions, user_features, item_features, train=None, test=None):
+        """Fit a new model on all interactions if it passes the holdout check, else return None.
+
+        Args:
+            current_model (LightFM): Published model, fitted on the train interactions.
+            interactions (coo_matrix): Interactions of all orders, which the new model is fitted on.
+            train (coo_matrix): Interactions of the orders the current model was fitted on.
+            test (coo_matrix): Interactions of the orders after those, which neither model of the check has seen.
+        """
+
+        if current_model is not None and self.__is_compatible(current_model, user_features, item_features) and train is not None and test is not None:
+            # Only user-menu pairs not in the train orders are hits, as precision_at_k needs disjoint matrices
+            train, test = train.tocsr(), test.tocsr()
+            test = (test - test.multiply(train > 0)).tocoo()
+            test.eliminate_zeros()
+
+            if train.nnz > 0 and test.nnz > 0:
+                candidate = self.__new_model()
+                candidate.fit(train, user_features=user_features, item_features=item_features, epochs=self.epochs, num_threads=self.num_threads)
+                candidate_precision = self.__precision(candidate, test, train, user_features, item_features)
+                current_precision = self.__precision(current_model, test, train, user_features, item_features)
+                print(f'Holdout precision@{self.k} on {test.nnz} new interactions: candidate {candidate_precision:.4f}, current {current_precision:.4f}')
+                if candidate_precision < current_precision - self.tolerance:
+                    return None
+            else:
+                print('No new interactions since the current model to compare on. Publishing the full refit.')
+
+        model = self.__new_model()
+        model.fit(interactions, user_features=user_features, item_features=item_features, epochs=self.epochs, num_threads=self.num_threads)
+        return model
+
+    def run(self, force_full_refit=False) -> bool:
+        """Run one retraining step. Returns True if a new model was published."""
+
+        db = database.SessionLocal()
+        try:
+            checkpoint = self.load_checkpoint()
+
+            feature_matrix = FeatureMatrixService()
+            feature_matrix.load(db=db)
+            user_features = feature_matrix.get_user_features()
+            item_features = feature_matrix.get_item_features()
+
+            try:
+                current_model = self.food_recommendation.load_model()
+            except FileNotFoundError:
+                current_model = None
+
+            compatible = current_model is not None and self.__is_compatible(current_model, user_features, item_features)
+            full_refit = force_full_refit or not compatible or checkpoint["runs_since_full_refit"] + 1 >= self.full_refit_every
+
+            # Read orders up to the latest order ID only, so orders created meanwhile go to the next run
+            last_order_id = order_crud.get_last_order_id(db=db)
+
+            model = None
+            if full_refit:
+                interactions = self.build_interactions(db, feature_matrix, 0, last_order_id)
+                if interactions.nnz > 0:
+                    # The current model has seen the orders up to the checkpoint, so the later orders are the holdout
+                    train = self.build_interactions(db, feature_matrix, 0, checkpoint["last_order_id"]) if compatible else None
+                    test = self.build_interactions(db, feature_matrix, checkpoint["last_order_id"], last_order_id) if compatible else None
+                    model = self.full_refit(current_model, interactions, user_features, item_features, train=train, test=test)
+                checkpoint["runs_since_full_refit"] = 0
+            else:
+                checkpoint["runs_since_full_refit"] += 1
+
+            if model is None and compatible:
+                # Update the current model with the interaction deltas only
+                interactions = self.build_interactions(db, feature_matrix, checkpoint["last_order_id"], last_order_id)
+                if interactions.nnz > 0:
+                    model = current_model
+                    model.fit_partial(interactions, user_features=user_features, item_features=item_features, epochs=self.incremental_epochs, num_threads=self.num_threads)
+
+            checkpoint["last_order_id"] = max(checkpoint["last_order_id"], last_order_id)
+
+            # Publish the model before the checkpoint, so a failed run is retried with the same orders
+            if model is not None:
+                self.food_recommendation.save_model(model, user_ids=feature_matrix.user_ids, menu_ids=feature_matrix.menu_ids)
+            self.save_checkpoint(checkpoint)
+
+            return model is not None
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Retrain the recommendation model from new orders.")
+    parser.add_argument("--full", action="store_true", help="Force a full refit with a holdout check.")
+    parser.add_argument("--num-threads", type=int, default=None, help="Number of threads used by LightFM.")
+    args = parser.parse_args()
+
+    trainer = ModelTrainer(FoodRecommendation(), num_threads=args.num_threads)
+    published = trainer.run(force_full_refit=args.full)
+    print("Published a new model." if published else "Kept the current model.")
@@ -0,0 +1,139 @@
+# Import general libraries
+import os
+import time
+import threading
+import numpy as np
+
+# Import Onnx runtime
+import onnxruntime as ort
+
+
+# Graph optimization levels by setting name
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+}
+
+# Element types of Onnx tensors used to build warm-up inputs
+ONNX_TENSOR_TYPES = {
+    "tensor(float)": np.float32,
+    "tensor(float16)": np.float16,
+    "tensor(double)": np.float64,
+    "tensor(uint8)": np.uint8,
+    "tensor(int8)": np.int8,
+    "tensor(int32)": np.int32,
+    "tensor(int64)": np.int64
+}
+
+# Precisions of the model variants, where the variants other than fp32 are made by scripts/quantize_recognition_models.py
+MODEL_PRECISIONS = ("fp32", "int8-dynamic", "int8-static", "fp16")
+
+
+def variant_model_path(model_path: str, precision: str) -> str:
+    """Get the path of a precision variant of a model, e.g. vgg19_initial.int8-dynamic.onnx for vgg19_initial.onnx."""
+
+    if precision not in MODEL_PRECISIONS:
+        raise ValueError(f'Invalid model precision: {precision}')
+    if precision == "fp32":
+        return model_path
+    root, extension = os.path.splitext(model_path)
+    return f'{root}.{precision}{extension}'
+
+
+class OnnxModel:
+    """Inference session of one Onnx model with its input and output names.
+
+    InferenceSession.run is thread-safe, so one session is shared by all request threads.
+    """
+
+    def __init__(self, model_path: str, session: ort.InferenceSession):
+        self.model_path = model_path
+        self.session = session
+
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_shape = model_input.shape
+        self.input_type = ONNX_TENSOR_TYPES.get(model_input.type, np.float32)
+        self.output_name = session.get_outputs()[0].name
+
+    def run(self, input_array: np.ndarray) -> np.ndarray:
+        """Run the model on a batch and get its first output."""
+        return self.session.run([self.output_name], {self.input_name: input_array})[0]
+
+    def warm_up(self, batch_size: int = 1) -> float:
+        """Run the model once on zeros, so the first request does not pay for lazy initialization. Returns the seconds taken."""
+
+        # Dynamic dimensions, e.g. the batch dimension, are named or None in the input shape
+        shape = [dim if isinstance(dim, int) and dim > 0 else 1 for dim in self.input_shape]
+        if shape and not (isinstance(self.input_shape[0], int) and self.input_shape[0] > 0):
+            shape[0] = batch_size
+
+        start = time.perf_counter()
+        self.run(np.zeros(shape, dtype=self.input_type))
+        return time.perf_counter() - start
+
+
+class OnnxSessionManager:
+    """Process-wide cache of Onnx inference sessions created with explicit session options.
+
+    Each model file is loaded and optimized once per process, preferably at startup with load(),
+    and the same session is handed out to every thread afterwards.
+    """
+
+    def __init__(self, intra_op_num_threads: int = None, inter_op_num_threads: int = None, graph_optimization_level: str = None):
+        """Initialize the session manager. Unset arguments are read from the environment.
+
+        Args:
+            intra_op_num_threads (int): Threads used within an operator, where 0 is the Onnx runtime default.
+            inter_op_num_threads (int): Threads used across operators, where 0 is the Onnx runtime default.
+            graph_optimization_level (str): One of "disable", "basic", "extended" or "all".
+        """
+
+        self.intra_op_num_threads = intra_op_num_threads if intra_op_num_threads is not None else int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+        self.inter_op_num_threads = inter_op_num_threads if inter_op_num_threads is not None else int(os.getenv("ONNX_INTER_OP_THREADS", "0"))
+        self.graph_optimization_level = graph_optimization_level or os.getenv("ONNX_GRAPH_OPTIMIZATION_LEVEL", "all")
+        if self.graph_optimization_level not in GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(f'Invalid graph optimization level: {self.graph_optimization_level}')
+
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def session_options(self) -> ort.SessionOptions:
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_num_threads
+        options.inter_op_num_threads = self.inter_op_num_threads
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[self.graph_optimization_level]
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        return options
+
+    def get(self, model_path: str) -> OnnxModel:
+        """Get the session of a model, creating it on the first call for the model."""
+
+        model = self._models.get(model_path)
+        if model is None:
+            with self._lock:
+                model = self._models.get(model_path)
+                if model is None:
+                    session = ort.InferenceSession(model_path, sess_options=self.session_options(), providers=["CPUExecutionProvider"])
+                    model = OnnxModel(model_path, session)
+                    self._models[model_path] = model
+        return model
+
+    def load(self, model_paths: list, warm_up: bool = True):
+        """Create the sessions of the given models and warm them up, e.g. at startup."""
+
+        for model_path in model_paths:
+            start = time.perf_counter()
+            model = self.get(model_path)
+            load_seconds = time.perf_counter() - start
+            warm_up_seconds = model.warm_up() if warm_up else 0.0
+            print(f'Loaded Onnx model "{model_path}" in {load_seconds:.2f} s, warm-up inference in {warm_up_seconds:.2f} s.')
+
+    def loaded_models(self) -> list:
+        return list(self._models)
+
+
+# Sessions shared by everything in the process
+session_manager = OnnxSessionManager()
@@ -0,0 +1,133 @@
+# Import general libraries
+import threading
+import numpy as np
+from PIL import Image
+from collections import OrderedDict
+
+
+# Number of bits of a difference hash
+HASH_BITS = 64
+
+
+def difference_hash(pixels: np.ndarray) -> int:
+    """Get the 64-bit difference hash (dHash) of RGB pixels.
+
+    The image is shrunk to 9 x 8 grayscale pixels and each bit tells whether a pixel is brighter than
+    its right neighbour, so recompressed, rescaled or slightly re-shot photos get hashes a few bits apart.
+    """
+
+    gray = np.asarray(Image.fromarray(pixels).convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class RecognitionCache:
+    """Bounded LRU cache of recognition results keyed by the perceptual hash of the photo.
+
+    A lookup matches any cached hash within max_distance bits. The hash is split into
+    max_distance + 1 bands, and two hashes within max_distance bits agree on at least one whole
+    band, so only the entries sharing a band with the photo are compared instead of all of them.
+    """
+
+    def __init__(self, max_size: int = 1024, max_distance: int = 4):
+        """Initialize the recognition cache.
+
+        Args:
+            max_size (int): Largest number of cached photos, where 0 turns the cache off.
+            max_distance (int): Largest Hamming distance between the hashes of photos treated as the same photo.
+        """
+
+        self.max_size = max_size
+        self.max_distance = max_distance
+
+        # Bit ranges of the bands, from the highest bits
+        edges = [int(edge) for edge in np.linspace(0, HASH_BITS, max_distance + 2)]
+        self.bands = [(HASH_BITS - end, (1 << (end - start)) - 1) for start, end in zip(edges[:-1], edges[1:])]
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._band_index = {}
+
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __band_keys(self, image_hash: int) -> list:
+        return [(band, (image_hash >> shift) & mask) for band, (shift, mask) in enumerate(self.bands)]
+
+    def __remove(self, image_hash: int):
+        self._entries.pop(image_hash, None)
+        for band_key in self.__band_keys(image_hash):
+            hashes = self._band_index.get(band_key)
+            if hashes is not None:
+                hashes.discard(image_hash)
+                if not hashes:
+                    del self._band_index[band_key]
+
+    def __nearest(self, image_hash: int):
+        best_hash, best_distance = None, self.max_distance + 1
+        for band_key in self.__band_keys(image_hash):
+            for cached_hash in self._band_index.get(band_key, ()):
+                distance = bin(cached_hash ^ image_hash).count("1")
+                if distance < best_distance:
+                    best_hash, best_distance = cached_hash, distance
+        return best_hash
+
+    def get(self, image_hash: int):
+        """Get the cached result of the nearest photo within max_distance bits, or None if there is none."""
+
+        if self.max_size <= 0:
+            return None
+
+        with self._lock:
+            if image_hash in self._entries:
+                cached_hash = image_hash
+                self.exact_hits += 1
+            else:
+                cached_hash = self.__nearest(image_hash) if self.max_distance > 0 else None
+                if cached_hash is None:
+                    self.misses += 1
+                    return None
+                self.near_hits += 1
+
+            self._entries.move_to_end(cached_hash)
+            return self._entries[cached_hash]
+
+    def put(self, image_hash: int, value):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            if image_hash not in self._entries:
+                for band_key in self.__band_keys(image_hash):
+                    self._band_index.setdefault(band_key, set()).add(image_hash)
+            self._entries[image_hash] = value
+            self._entries.move_to_end(image_hash)
+
+            # Evict the least recently used entries
+            while len(self._entries) > self.max_size:
+                self.__remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all entries, e.g. when the recognition models are loaded."""
+
+        with self._lock:
+            self._entries.clear()
+            self._band_index.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.near_hits
+            requests = hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "max_distance": self.max_distance,
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": hits / requests if requests else 0.0
+            }
@@ -0,0 +1,84 @@
+# Import general libraries
+import time
+import threading
+from collections import OrderedDict
+
+
+class RecommendationCache:
+    """Bounded LRU cache of recommendation results with a time to live.
+
+    Keys are (user_id, meal_time, summary_version) tuples. The summary version is the date and the
+    ID of the user's last order, so orders created by other workers also miss the cache, while
+    orders created by this worker invalidate the user's entries right away.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._user_keys = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __remove(self, key):
+        self._entries.pop(key, None)
+        user_keys = self._user_keys.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._user_keys[key[0]]
+
+    def get(self, key):
+        """Get the cached result of the key, or None if it is missing or expired."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self.__remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._user_keys.setdefault(key[0], set()).add(key)
+
+            # Evict the least recently used entries
+            while len(self._entries) > self.max_size:
+                self.__remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int, **kwargs):
+        """Remove all entries of a user. Connected to the order creation signal."""
+
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                self.__remove(key)
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / requests if requests else 0.0
+            }
@@ -0,0 +1,91 @@
+# Import general libraries
+import argparse
+import numpy as np
+
+# Import database
+import database
+import routers.recommendation.crud as recommendation_crud
+from routers.line_bot.menu_catalog import MEAL_TIMES
+from routers.line_bot.feature_matrix import FeatureMatrixService
+from routers.line_bot.embedding_index import EmbeddingIndex
+from routers.line_bot.food_recommendation import FoodRecommendation
+
+
+class RecommendationJob:
+    """Precompute a ranked candidate list for every user and every meal time.
+
+    The stored score is the slowly changing part of the recommendation score, i.e. the weighted
+    preference and meal-time terms. The online path only adds the similarity penalty and the
+    nutrition-goal score of the user's daily summary on top of it.
+    """
+
+    def __init__(self, food_recommendation: FoodRecommendation, n_candidates=50, chunk_size=1024, w1=0.3, w4=0.2):
+        self.food_recommendation = food_recommendation
+        self.n_candidates = n_candidates
+        self.chunk_size = chunk_size
+        self.w1 = w1
+        self.w4 = w4
+
+    def rank_candidates(self, preference_scores: np.ndarray, time_scores: np.ndarray) -> tuple:
+        """Rank the candidates of a users x menus preference matrix for one meal time.
+
+        Returns:
+            candidates (tuple): Menu rows and scores of the top candidates, both users x n_candidates.
+        """
+
+        # Normalize the preference ratings of each user
+        MinPreference = preference_scores.min(axis=1, keepdims=True)
+        preference_range = preference_scores.max(axis=1, keepdims=True) - MinPreference
+        preference_range[preference_range == 0] = 1
+        NormalizedPreferenceRating = (preference_scores - MinPreference) / preference_range
+
+        base_scores = self.w1 * NormalizedPreferenceRating + self.w4 * time_scores
+
+        # Top candidates of each user sorted by score
+        k = min(self.n_candidates, base_scores.shape[1])
+        top = np.argpartition(-base_scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(base_scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def run(self):
+        db = database.SessionLocal()
+        try:
+            model = self.food_recommendation.load_model()
+
+            feature_matrix = FeatureMatrixService()
+            feature_matrix.load(db=db)
+            user_features = feature_matrix.get_user_features()
+            menu_ids = np.asarray(feature_matrix.menu_ids, dtype=np.int64)
+            nutrient_table = self.food_recommendation.menu_catalog.nutrient_table(db, menu_ids)
+
+            embedding_index = EmbeddingIndex(model, feature_matrix.get_item_features())
+
+            user_ids = feature_matrix.user_ids
+            for start in range(0, len(user_ids), self.chunk_size):
+                chunk_user_ids = user_ids[start:start + self.chunk_size]
+                preference_scores = embedding_index.score_users(np.arange(start, start + len(chunk_user_ids)), user_features).astype(np.float64)
+
+                candidates = []
+                for meal_time in MEAL_TIMES:
+                    menu_rows, scores = self.rank_candidates(preference_scores, nutrient_table.meal_time_scores(meal_time))
+                    for user_id, user_menu_rows, user_scores in zip(chunk_user_ids, menu_rows, scores):
+                        candidates.extend(
+                            {"user_id": user_id, "meal_time": meal_time, "menu_id": int(menu_id), "rank": rank, "score": float(score)}
+                            for rank, (menu_id, score) in enumerate(zip(menu_ids[user_menu_rows], user_scores))
+                        )
+
+                # Replace the lists of this chunk of users in one transaction
+                recommendation_crud.replace_recommendation_candidates(db, user_ids=chunk_user_ids, candidates=candidates)
+                print(f'Precomputed recommendation candidates of {start + len(chunk_user_ids)}/{len(user_ids)} users.')
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompute recommendation candidates of every user and meal time.")
+    parser.add_argument("--n-candidates", type=int, default=50, help="Number of candidates per user and meal time.")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="Number of users scored at once.")
+    args = parser.parse_args()
+
+    RecommendationJob(FoodRecommendation(), n_candidates=args.n_candidates, chunk_size=args.chunk_size).run()
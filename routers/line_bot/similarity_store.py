@@ -0,0 +1,185 @@
+# Import general libraries
+import os
+import glob
+import hashlib
+import threading
+import numpy as np
+
+# Import libraries for similarity
+from scipy.sparse import csr_matrix
+from sklearn.metrics.pairwise import cosine_similarity
+
+
+class SimilarityStore:
+    """Item-item cosine similarity of the menu features, computed once per version of the menu features.
+
+    Small catalogs keep the full menus x menus matrix. Catalogs larger than dense_limit keep only the
+    top_k most similar menus of every menu, so memory stays O(M * top_k). Each version is persisted to
+    cache_dir, so restarted workers load it from disk instead of recomputing it.
+
+    The version is the content hash of the menu features passed in, so a worker follows menu changes
+    made through other workers as soon as its feature matrix does. The hash is only recomputed when a
+    different feature matrix object is passed in or the store is invalidated.
+    """
+
+    def __init__(self, cache_dir: str = "assets/models/similarity", dense_limit: int = 2000, top_k: int = 100, chunk_size: int = 1024):
+        self.cache_dir = cache_dir
+        self.dense_limit = dense_limit
+        self.top_k = top_k
+        self.chunk_size = chunk_size
+
+        # The loaded similarity is swapped as a whole, so readers never see a mix of two versions
+        self._lock = threading.Lock()
+        self._stale = True
+        self._state = None
+        self._checked_features = None
+
+    @staticmethod
+    def feature_version(food_features) -> str:
+        """Get a content hash of the menu feature matrix used as the similarity version."""
+
+        food_features = csr_matrix(food_features, dtype=np.float64)
+        food_features.sort_indices()
+        digest = hashlib.sha1()
+        digest.update(np.asarray(food_features.shape, dtype=np.int64).tobytes())
+        for array in (food_features.indptr, food_features.indices, food_features.data):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+    @property
+    def version(self):
+        return self._state["version"] if self._state else None
+
+    def invalidate(self, **kwargs):
+        """Check the version on the next read. Connected to the menu and menu feature change signals."""
+        self._stale = True
+
+    def __cache_path(self, version: str) -> str:
+        return os.path.join(self.cache_dir, f"{version}.npz")
+
+    def __compute(self, food_features):
+        n_items = food_features.shape[0]
+
+        if n_items <= self.dense_limit:
+            return {"matrix": cosine_similarity(food_features).astype(np.float32)}
+
+        # Keep only the top k neighbors of every menu, computed in chunks of rows to bound memory
+        k = min(self.top_k, n_items)
+        neighbor_indices = np.empty((n_items, k), dtype=np.int32)
+        neighbor_scores = np.empty((n_items, k), dtype=np.float32)
+        for start in range(0, n_items, self.chunk_size):
+            chunk = cosine_similarity(food_features[start:start + self.chunk_size], food_features)
+            top = np.argpartition(-chunk, k - 1, axis=1)[:, :k]
+            neighbor_indices[start:start + len(chunk)] = top
+            neighbor_scores[start:start + len(chunk)] = np.take_along_axis(chunk, top, axis=1)
+
+        return {"neighbor_indices": neighbor_indices, "neighbor_scores": neighbor_scores}
+
+    def __save(self, version: str, arrays: dict):
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Write to a temporary file and rename it, so other workers never read a partial file
+        path = self.__cache_path(version)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as fle:
+            np.savez(fle, **arrays)
+        os.replace(tmp_path, path)
+
+        # Remove the persisted similarity of versions written before this one. Files of other workers written
+        # meanwhile are kept, and files another worker removed first are skipped.
+        try:
+            saved_at = os.path.getmtime(path)
+        except FileNotFoundError:
+            return
+        for old_path in glob.glob(os.path.join(self.cache_dir, "*.npz")):
+            if old_path == path:
+                continue
+            try:
+                if os.path.getmtime(old_path) < saved_at:
+                    os.remove(old_path)
+            except FileNotFoundError:
+                pass
+
+    def __load(self, version: str):
+        # A file removed by another worker after the check is a cache miss too
+        path = self.__cache_path(version)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path) as npz:
+                return {name: npz[name] for name in npz.files}
+        except FileNotFoundError:
+            return None
+
+    def refresh(self, food_features):
+        """Load or compute the similarity of the given menu features if their version differs from the loaded one."""
+
+        # The same feature matrix object as the last checked one has the same version
+        state = self._state
+        if not self._stale and state is not None and self._checked_features is food_features:
+            return state
+
+        with self._lock:
+            if not self._stale and self._state is not None and self._checked_features is food_features:
+                return self._state
+
+            # Clear the flag before computing, so an invalidation during the computation is not lost
+            self._stale = False
+            checked_features = food_features
+            try:
+                food_features = csr_matrix(food_features, dtype=np.float64)
+                version = self.feature_version(food_features)
+                if self._state is not None and self._state["version"] == version:
+                    self._checked_features = checked_features
+                    return self._state
+
+                arrays = self.__load(version)
+                if arrays is None:
+                    arrays = self.__compute(food_features)
+                    self.__save(version, arrays)
+            except Exception:
+                self._stale = True
+                raise
+
+            # Rows are handed out as views, so the shared arrays are read-only
+            for array in arrays.values():
+                array.setflags(write=False)
+
+            arrays["version"] = version
+            arrays["n_items"] = food_features.shape[0]
+            self._state = arrays
+            self._checked_features = checked_features
+            return self._state
+
+    def row(self, food_id: int, food_features) -> np.ndarray:
+        """Get the similarity of the given menu against all menus.
+
+        Args:
+            food_id (int): Row of the menu in the menu feature matrix.
+            food_features (csr_matrix): Menu feature matrix, hashed when it is a different object than on the last read.
+
+        Returns:
+            similarity (np.ndarray): Similarity of every menu. Menus outside the top k neighbors are 0.
+        """
+
+        state = self.refresh(food_features)
+
+        if "matrix" in state:
+            return state["matrix"][food_id]
+
+        similarity = np.zeros(state["n_items"], dtype=np.float32)
+        similarity[state["neighbor_indices"][food_id]] = state["neighbor_scores"][food_id]
+        return similarity
+
+    def rows(self, food_ids, food_features) -> np.ndarray:
+        """Get the similarity of each of the given menus against all menus as a matrix."""
+
+        state = self.refresh(food_features)
+        food_ids = np.asarray(food_ids, dtype=np.int64)
+
+        if "matrix" in state:
+            return state["matrix"][food_ids]
+
+        similarity = np.zeros((len(food_ids), state["n_items"]), dtype=np.float32)
+        np.put_along_axis(similarity, state["neighbor_indices"][food_ids], state["neighbor_scores"][food_ids], axis=1)
+        return similarity
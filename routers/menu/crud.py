@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Session
 
-import models, schemas
+import models, schemas, signals
 
 # Menu
 def get_menu(db: Session, menu_id: int):
@@ -18,6 +18,7 @@ def create_menu(db: Session, menu: schemas.MenuCreate):
     db.add(db_menu)
     db.commit()
     db.refresh(db_menu)
+    signals.menu_changed.send(menu_id=db_menu.id)
     return db_menu
 
 def get_menus_for_recommendation(db: Session):
@@ -34,4 +35,24 @@ def get_menus_for_recommendation(db: Session):
 
 # Menu Feature
 def get_menu_features(db: Session):
-    return db.query(models.MenuFeature).order_by(models.MenuFeature.menu_id).all()
\ No newline at end of file
+    return db.query(models.MenuFeature).order_by(models.MenuFeature.menu_id).all()
+
+def get_menu_feature(db: Session, menu_id: int):
+    return db.query(models.MenuFeature).filter(models.MenuFeature.menu_id == menu_id).first()
+
+def create_menu_feature(db: Session, menu_feature: schemas.MenuFeatureCreate):
+    db_menu_feature = models.MenuFeature(**menu_feature.dict())
+    db.add(db_menu_feature)
+    db.commit()
+    db.refresh(db_menu_feature)
+    signals.menu_feature_changed.send(menu_id=db_menu_feature.menu_id, menu_feature=db_menu_feature)
+    return db_menu_feature
+
+def update_menu_feature(db: Session, menu_feature: schemas.MenuFeatureCreate):
+    db_menu_feature = get_menu_feature(db, menu_id=menu_feature.menu_id)
+    for key, value in menu_feature.dict().items():
+        setattr(db_menu_feature, key, value)
+    db.commit()
+    db.refresh(db_menu_feature)
+    signals.menu_feature_changed.send(menu_id=db_menu_feature.menu_id, menu_feature=db_menu_feature)
+    return db_menu_feature
@@ -26,6 +26,14 @@ def create_menu(menu: schemas.MenuCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Menu already registered")
     return crud.create_menu(db=db, menu=menu)
 
+@router.post("/features/", response_model=schemas.MenuFeature)
+def create_or_update_menu_feature(menu_feature: schemas.MenuFeatureCreate, db: Session = Depends(get_db)):
+    if crud.get_menu(db, menu_id=menu_feature.menu_id) is None:
+        raise HTTPException(status_code=404, detail="Menu not found")
+    if crud.get_menu_feature(db, menu_id=menu_feature.menu_id):
+        return crud.update_menu_feature(db=db, menu_feature=menu_feature)
+    return crud.create_menu_feature(db=db, menu_feature=menu_feature)
+
 @router.get("/", response_model=Dict[str, schemas.Menu])
 def read_menus(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     return crud.get_menus(db, skip=skip, limit=limit)
@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
-import models, schemas
+from sqlalchemy import func, and_, select
+import models, schemas, signals
 from datetime import datetime, timedelta
 
 def get_order(db: Session, order_id: int):
@@ -42,9 +42,49 @@ def get_daily_summary(db: Session, user_id: int):
 def get_orders(db: Session):
     return db.query(models.Order).all()
 
+def get_last_order_id(db: Session):
+    return db.query(func.max(models.Order.id)).scalar() or 0
+
+def get_last_order_id_of_user(db: Session, user_id: int):
+    return db.query(func.max(models.Order.id)).filter(models.Order.user_id == user_id).scalar() or 0
+
+def get_split_order_id(db: Session, train_fraction: float):
+    """Get the ID of the last order of the oldest train_fraction of the orders by ID.
+
+    Callers split the orders with Order.id <= the returned ID, like the training checkpoints do, so the
+    cutoff is chosen by ID too. IDs are assigned on insert, i.e. in creation order up to concurrent inserts.
+    """
+
+    n_orders = db.query(func.count(models.Order.id)).scalar()
+    if not n_orders:
+        return 0
+    offset = max(int(n_orders * train_fraction) - 1, 0)
+    return db.query(models.Order.id).order_by(models.Order.id).offset(offset).limit(1).scalar()
+
+def stream_interaction_ratings(db: Session, since_order_id: int = 0, until_order_id: int = None, missing_rating: float = 0.0, chunk_size: int = 10000):
+    """Stream (user_id, menu_id, mean rating) rows aggregated in SQL, in chunks fetched with a server-side cursor."""
+
+    filters = [models.Order.id > since_order_id]
+    if until_order_id is not None:
+        filters.append(models.Order.id <= until_order_id)
+
+    query = (
+        select(
+            models.Order.user_id,
+            models.Order.menu_id,
+            func.coalesce(func.avg(models.Order.rating), missing_rating).label("rating")
+        )
+        .filter(and_(*filters))
+        .group_by(models.Order.user_id, models.Order.menu_id)
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    )
+
+    return db.execute(query).partitions(chunk_size)
+
 def create_order(db: Session, order: schemas.OrderCreate):
     db_order = models.Order(**order.dict())
     db.add(db_order)
     db.commit()
     db.refresh(db_order)
+    signals.order_created.send(user_id=db_order.user_id, order=db_order)
     return db_order
\ No newline at end of file
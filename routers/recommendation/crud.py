@@ -0,0 +1,22 @@
+from sqlalchemy.orm import Session
+
+import models
+
+# Recommendation Candidate
+def get_recommendation_candidates(db: Session, user_id: int, meal_time: str):
+    return (
+        db.query(models.RecommendationCandidate)
+        .filter(
+            models.RecommendationCandidate.user_id == user_id,
+            models.RecommendationCandidate.meal_time == meal_time
+        )
+        .order_by(models.RecommendationCandidate.rank)
+        .all()
+    )
+
+def replace_recommendation_candidates(db: Session, user_ids: list, candidates: list):
+    """Replace the candidates of the given users in one transaction, so readers see either the old or the new lists."""
+
+    db.query(models.RecommendationCandidate).filter(models.RecommendationCandidate.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.RecommendationCandidate, candidates)
+    db.commit()
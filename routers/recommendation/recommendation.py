@@ -0,0 +1,61 @@
+import os
+import secrets
+from fastapi import APIRouter, Depends, HTTPException, Header
+from sqlalchemy.orm import Session
+from typing import List
+
+import schemas, database
+from routers.line_bot.bot import food_recommendation
+from routers.line_bot.menu_catalog import NUTRIENTS, MEAL_TIMES
+from routers.line_bot.candidate_index import CandidateIndex
+
+def verify_internal_api_key(x_internal_api_key: str = Header(None)):
+    """Allow only callers sending the shared secret of INTERNAL_API_KEY in the X-Internal-Api-Key header.
+
+    The endpoints are closed while INTERNAL_API_KEY is not set.
+    """
+
+    internal_api_key = os.getenv("INTERNAL_API_KEY")
+    if not internal_api_key:
+        raise HTTPException(status_code=503, detail="Internal API key not configured")
+    if x_internal_api_key is None or not secrets.compare_digest(x_internal_api_key.encode(), internal_api_key.encode()):
+        raise HTTPException(status_code=401, detail="Invalid internal API key")
+
+router = APIRouter(
+    prefix="/internal/recommendations",
+    tags=["recommendation"],
+    dependencies=[Depends(verify_internal_api_key)],
+    responses={404: {"description": "Not found"}}
+)
+
+# Dependency
+def get_db():
+    db = database.SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@router.post("/batch", response_model=List[schemas.RecommendationResult])
+def recommend_batch(batch: schemas.RecommendationBatchRequest, db: Session = Depends(get_db)):
+    model = food_recommendation.model_holder.get()
+    if model is None:
+        raise HTTPException(status_code=503, detail="Recommendation model not loaded")
+
+    for request in batch.requests:
+        if request.meal_time not in MEAL_TIMES:
+            raise HTTPException(status_code=400, detail=f"Invalid meal time: {request.meal_time}")
+        if any(nutrient not in request.nutritional_goal_left for nutrient in NUTRIENTS):
+            raise HTTPException(status_code=400, detail=f"Nutritional goal must contain {', '.join(NUTRIENTS)}")
+        unknown_constraints = CandidateIndex.validate(request.dietary_constraints)
+        if unknown_constraints:
+            raise HTTPException(status_code=400, detail=f"Unknown dietary constraints: {', '.join(unknown_constraints)}")
+
+    return food_recommendation.recommend_batch(
+        db=db,
+        model=model,
+        requests=[request.dict() for request in batch.requests],
+        n_recommendations=batch.n_recommendations,
+        diversity=food_recommendation.diversity,
+        shortlist_size=food_recommendation.diversity_shortlist
+    )
@@ -1,7 +1,7 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
-import models, schemas
+import models, schemas, signals
 
 from routers.user_feature import crud
 
@@ -42,6 +42,9 @@ def get_user(db: Session, user_id: int):
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.User).order_by(models.User.id).all()
 
+def get_users_after(db: Session, user_id: int):
+    return db.query(models.User).filter(models.User.id > user_id).order_by(models.User.id).all()
+
 def get_user_by_line_id(db: Session, line_id: str):
     return db.query(models.User).filter(models.User.line_id == line_id).first()
 
@@ -60,6 +63,7 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    signals.user_created.send(user=db_user)
 
     # Create user state
     db_user_state = create_user_state(db, schemas.UserStateCreate(user_id=db_user.id, line_id=user.line_id, state=user.state))
@@ -1,7 +1,7 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import text, func
 
-import models, schemas
+import models, schemas, signals
 
 def get_user_feature(db: Session, user_feature_id: int):
     return db.query(models.UserFeature).filter(models.UserFeature.id == user_feature_id).first()
@@ -16,9 +16,15 @@ def get_user_features(db: Session, skip: int = 0, limit: int = 100):
     all_user_features = db.query(models.UserFeature).offset(skip).limit(limit).all()
     return all_user_features
 
+def get_user_features_after(db: Session, user_feature_id: int):
+    return db.query(models.UserFeature).filter(models.UserFeature.id > user_feature_id).order_by(models.UserFeature.id).all()
+
+def get_max_user_feature_id(db: Session):
+    return db.query(func.max(models.UserFeature.id)).scalar() or 0
+
 def get_user_features_flag(db: Session):
     query = text("""
-        select cheap, chicken, fried, pork, salty, soup, spicy, steam, sweet, vegetable
+        select user_id, cheap, chicken, fried, pork, salty, soup, spicy, steam, sweet, vegetable
         from (
         select user_id,
             sum(case when feature_id = 1 then 1 else 0 end) as "cheap",
@@ -45,6 +51,7 @@ def create_user_feature(db: Session, user_feature: schemas.UserFeatureCreate):
     db.add(db_user_feature)
     db.commit()
     db.refresh(db_user_feature)
+    signals.user_features_created.send(user_id=db_user_feature.user_id, feature_ids=[db_user_feature.feature_id])
     return db_user_feature
 
 def create_multiple_user_features(db: Session, user_multiple_features: schemas.UserMultipleFeatuerCreate):
@@ -59,4 +66,5 @@ def create_multiple_user_features(db: Session, user_multiple_features: schemas.U
     
     db.commit()
     db.refresh(db_user_feature)
+    signals.user_features_created.send(user_id=user_id, feature_ids=feature_ids)
     return db_user_features
\ No newline at end of file
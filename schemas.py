@@ -1,4 +1,4 @@
-from typing import Union, List
+from typing import Union, List, Dict, Optional
 
 from pydantic import BaseModel
 from datetime import datetime
@@ -134,4 +134,20 @@ class MenuFeatureCreate(MenuFeatureBase):
 
 class MenuFeature(MenuFeatureBase):
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class RecommendationRequest(BaseModel):
+    user_id: int
+    nutritional_goal_left: Dict[str, float]
+    meal_time: str
+    previous_menu_id: Optional[int] = None
+    dietary_constraints: List[str] = []
+
+class RecommendationBatchRequest(BaseModel):
+    requests: List[RecommendationRequest]
+    n_recommendations: int = 5
+
+class RecommendationResult(BaseModel):
+    user_id: int
+    menu_ids: List[int]
+    scores: List[float]
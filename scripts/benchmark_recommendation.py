@@ -0,0 +1,279 @@
+# Import general libraries
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timedelta
+import numpy as np
+
+# Import LightFM and other libraries for recommendation
+from lightfm import LightFM
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Import database
+import models
+from database import Base
+from routers.line_bot.menu_catalog import MenuCatalog, MEAL_TIMES
+from routers.line_bot.feature_matrix import FeatureMatrixService, USER_PREFERENCES, MENU_FEATURES
+from routers.line_bot.interaction_matrix import build_interaction_matrix
+from routers.line_bot.similarity_store import SimilarityStore
+from routers.line_bot.embedding_index import EmbeddingIndex
+from routers.line_bot.food_recommendation import FoodRecommendation
+
+
+# Synthetic data sizes, from the size of the mock food dataset up to the target scale
+SCALES = {
+    "mock": {"users": 80, "menus": 20, "orders_per_user": 10},
+    "small": {"users": 1000, "menus": 200, "orders_per_user": 20},
+    "medium": {"users": 10000, "menus": 1000, "orders_per_user": 20},
+    "large": {"users": 100000, "menus": 10000, "orders_per_user": 20}
+}
+
+# Nutritional goal left of the benchmark requests
+NUTRITIONAL_GOAL_LEFT = {"Calories": 800.0, "Fat": 30.0, "Carbs": 100.0, "Protein": 40.0}
+
+
+def generate_data(engine, users: int, menus: int, orders_per_user: int, seed: int = 0, chunk_size: int = 10000):
+    """Insert synthetic users, menus, menu features, user features and orders."""
+
+    rng = np.random.default_rng(seed)
+
+    def insert(table, rows):
+        with engine.begin() as connection:
+            for start in range(0, len(rows), chunk_size):
+                connection.execute(table.insert(), rows[start:start + chunk_size])
+
+    insert(models.Feature.__table__, [{"id": feature_id, "name": name} for feature_id, name in enumerate(USER_PREFERENCES, start=1)])
+
+    # Menus with nutrients and meal-time probabilities in the ranges of the mock food dataset
+    meal_times = rng.dirichlet(np.ones(len(MEAL_TIMES)), size=menus)
+    insert(models.Menu.__table__, [{
+        "id": menu_id + 1,
+        "name": f"menu_{menu_id + 1}",
+        "calorie": float(rng.uniform(150, 900)),
+        "fat": float(rng.uniform(2, 45)),
+        "carbohydrate": float(rng.uniform(10, 120)),
+        "protein": float(rng.uniform(5, 60)),
+        "breakfast": float(meal_times[menu_id, 0]),
+        "lunch": float(meal_times[menu_id, 1]),
+        "dinner": float(meal_times[menu_id, 2])
+    } for menu_id in range(menus)])
+
+    menu_features = rng.integers(0, 2, size=(menus, len(MENU_FEATURES)))
+    insert(models.MenuFeature.__table__, [
+        dict(menu_id=menu_id + 1, **{name: int(value) for name, value in zip(MENU_FEATURES, menu_features[menu_id])})
+        for menu_id in range(menus)
+    ])
+
+    birth_years = rng.integers(1960, 2005, size=users)
+    insert(models.User.__table__, [{
+        "id": user_id + 1,
+        "line_id": f"U{user_id + 1:032d}",
+        "name": f"user_{user_id + 1}",
+        "birth_date": datetime(int(birth_years[user_id]), 1, 1),
+        "gender": "Male" if user_id % 2 else "Female",
+        "weight": float(rng.uniform(40, 110)),
+        "height": float(rng.uniform(145, 195))
+    } for user_id in range(users)])
+
+    # Each user picks up to three food preferences
+    user_features = []
+    for user_id, n_features in enumerate(rng.integers(0, 4, size=users)):
+        for feature_id in rng.choice(len(USER_PREFERENCES), size=n_features, replace=False):
+            user_features.append({"user_id": user_id + 1, "feature_id": int(feature_id) + 1})
+    insert(models.UserFeature.__table__, user_features)
+
+    # Orders with a long-tailed menu popularity, where some orders are not rated
+    popularity = 1.0 / np.arange(1, menus + 1)
+    order_menus = rng.choice(menus, size=users * orders_per_user, p=popularity / popularity.sum()) + 1
+    ratings = rng.integers(1, 6, size=users * orders_per_user)
+    rated = rng.random(users * orders_per_user) < 0.7
+    start_time = datetime(2023, 1, 1)
+    insert(models.Order.__table__, [{
+        "user_id": order_index // orders_per_user + 1,
+        "menu_id": int(order_menus[order_index]),
+        "rating": int(ratings[order_index]) if rated[order_index] else None,
+        "create_at": start_time + timedelta(minutes=order_index)
+    } for order_index in range(users * orders_per_user)])
+
+    return {"users": users, "menus": menus, "menu_features": menus, "user_features": len(user_features), "orders": users * orders_per_user}
+
+
+def summarize(durations: list) -> dict:
+    durations_ms = np.asarray(durations, dtype=np.float64) * 1000
+    return {
+        "runs": len(durations_ms),
+        "mean_ms": float(durations_ms.mean()),
+        "p50_ms": float(np.percentile(durations_ms, 50)),
+        "p95_ms": float(np.percentile(durations_ms, 95)),
+        "min_ms": float(durations_ms.min()),
+        "max_ms": float(durations_ms.max())
+    }
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark_scale(database_url: str, name: str, scale: dict, args) -> dict:
+    """Generate the data of one scale and time each stage of the recommendation branch."""
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    print(f'Generating {name} data: {scale["users"]} users x {scale["menus"]} menus.')
+    counts, generate_seconds = timed(generate_data, engine, seed=args.seed, **scale)
+
+    rng = np.random.default_rng(args.seed)
+    stages = {}
+    db = SessionLocal()
+    try:
+        # Stages of the model and feature preparation, timed over the repeats
+        durations = {"feature_loading": [], "interaction_matrix": [], "nutrient_table": []}
+        for _ in range(args.repeat):
+            feature_matrix = FeatureMatrixService()
+            _, seconds = timed(feature_matrix.load, db)
+            durations["feature_loading"].append(seconds)
+
+            interactions, seconds = timed(build_interaction_matrix, db, user_ids=feature_matrix.user_ids, menu_ids=feature_matrix.menu_ids)
+            durations["interaction_matrix"].append(seconds)
+
+            nutrient_table, seconds = timed(MenuCatalog().nutrient_table, db, feature_matrix.menu_ids)
+            durations["nutrient_table"].append(seconds)
+
+        user_features = feature_matrix.get_user_features()
+        item_features = feature_matrix.get_item_features()
+
+        model = LightFM(no_components=args.no_components, loss='warp', random_state=args.seed)
+        _, seconds = timed(model.fit, interactions.matrix.tocsr(), user_features=user_features, item_features=item_features, epochs=args.epochs, num_threads=args.num_threads)
+        stages["model_fit"] = summarize([seconds])
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            similarity_store = SimilarityStore(cache_dir=cache_dir)
+            _, seconds = timed(similarity_store.refresh, item_features)
+            stages["similarity_build"] = summarize([seconds])
+
+            embedding_index, seconds = timed(EmbeddingIndex, model, item_features)
+            stages["embedding_index_build"] = summarize([seconds])
+
+            food_recommendation = FoodRecommendation()
+            food_recommendation.similarity_store = similarity_store
+
+            # Stages of a single recommendation request, timed over a sample of users
+            request_stages = ["model_predict", "embedding_score", "similarity", "nutrient_scoring", "top_n", "end_to_end"]
+            durations.update({stage: [] for stage in request_stages})
+            item_indices = np.arange(len(nutrient_table))
+            for user_index in rng.choice(user_features.shape[0], size=min(args.requests, user_features.shape[0]), replace=False):
+                user_index = int(user_index)
+                food_id = int(rng.integers(len(nutrient_table)))
+                meal_time = MEAL_TIMES[int(rng.integers(len(MEAL_TIMES)))]
+
+                predictions, seconds = timed(model.predict, user_index, item_indices, user_features=user_features, item_features=item_features)
+                durations["model_predict"].append(seconds)
+
+                scores, seconds = timed(embedding_index.score, user_index, user_features)
+                durations["embedding_score"].append(seconds)
+
+                similarity, seconds = timed(similarity_store.row, food_id, item_features)
+                durations["similarity"].append(seconds)
+
+                nutrient_scores, seconds = timed(food_recommendation.average_nutrient_scores, nutrient_table, item_indices, NUTRITIONAL_GOAL_LEFT, 0.001, 0.002, 1)
+                durations["nutrient_scoring"].append(seconds)
+
+                final_scores = 0.3 * scores - 0.2 * similarity + 0.3 * nutrient_scores + 0.2 * nutrient_table.meal_time_scores(meal_time)
+                _, seconds = timed(food_recommendation.top_n_indices, final_scores, args.n_recommendations)
+                durations["top_n"].append(seconds)
+
+                # The whole scoring path of the bot, without the database reads that are cached in the service
+                _, seconds = timed(food_recommendation.dynamic_food_recommend, model, None, user_index, user_features, food_id, nutrient_table.food_names,
+                                   item_features, nutrient_table, NUTRITIONAL_GOAL_LEFT, meal_time, n_recommendations=args.n_recommendations,
+                                   embedding_index=embedding_index, n_candidates=args.n_candidates)
+                durations["end_to_end"].append(seconds)
+    finally:
+        db.close()
+        engine.dispose()
+
+    stages.update({stage: summarize(stage_durations) for stage, stage_durations in durations.items()})
+    return {"name": name, "counts": counts, "generate_seconds": generate_seconds, "stages": stages}
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """Get the stages whose mean latency grew by more than the threshold ratio over the baseline."""
+
+    baseline_scales = {scale["name"]: scale for scale in baseline.get("scales", [])}
+    regressions = []
+    for scale in report["scales"]:
+        baseline_scale = baseline_scales.get(scale["name"])
+        if baseline_scale is None:
+            continue
+        for stage, stats in scale["stages"].items():
+            baseline_stats = baseline_scale["stages"].get(stage)
+            if baseline_stats and baseline_stats["mean_ms"] > 0 and stats["mean_ms"] / baseline_stats["mean_ms"] > threshold:
+                regressions.append({
+                    "scale": scale["name"],
+                    "stage": stage,
+                    "baseline_mean_ms": baseline_stats["mean_ms"],
+                    "mean_ms": stats["mean_ms"],
+                    "ratio": stats["mean_ms"] / baseline_stats["mean_ms"]
+                })
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the latency of each recommendation stage on synthetic data of several scales.")
+    parser.add_argument("--database-url", default=None,
+                        help="Database of the synthetic data, e.g. a local Postgres container. Its tables are dropped and recreated for each scale. Defaults to a temporary SQLite file.")
+    parser.add_argument("--scales", default="mock,small,medium", help=f"Comma-separated scales out of {', '.join(SCALES)}.")
+    parser.add_argument("--requests", type=int, default=50, help="Number of users sampled for the per-request stages.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of the loading stages.")
+    parser.add_argument("--n-recommendations", type=int, default=5, help="Number of recommended menus.")
+    parser.add_argument("--n-candidates", type=int, default=None, help="Number of preference candidates of the end-to-end stage.")
+    parser.add_argument("--no-components", type=int, default=32, help="Embedding size of the benchmark model.")
+    parser.add_argument("--epochs", type=int, default=5, help="Epochs of the benchmark model.")
+    parser.add_argument("--num-threads", type=int, default=os.cpu_count() or 1, help="Threads of the model fit.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data.")
+    parser.add_argument("--output", default="benchmark_report.json", help="Path of the JSON report.")
+    parser.add_argument("--baseline", default=None, help="Previous JSON report to compare against.")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Mean latency ratio over the baseline reported as a regression.")
+    args = parser.parse_args()
+
+    unknown_scales = [name for name in args.scales.split(",") if name not in SCALES]
+    if unknown_scales:
+        parser.error(f"Unknown scales: {', '.join(unknown_scales)}")
+
+    with tempfile.TemporaryDirectory() as database_dir:
+        database_url = args.database_url or f"sqlite:///{os.path.join(database_dir, 'benchmark.db')}"
+
+        report = {
+            "created_at": datetime.now().isoformat(),
+            "database": database_url.split("://")[0],
+            "environment": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform()},
+            "settings": {key: value for key, value in vars(args).items() if key not in ("database_url", "output", "baseline")},
+            "scales": []
+        }
+        for name in args.scales.split(","):
+            scale_report = benchmark_scale(database_url, name, SCALES[name], args)
+            report["scales"].append(scale_report)
+            for stage, stats in scale_report["stages"].items():
+                print(f'{name:>8} {stage:<22} mean {stats["mean_ms"]:10.3f} ms  p95 {stats["p95_ms"]:10.3f} ms')
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.threshold)
+        for regression in report["regressions"]:
+            print(f'Regression in {regression["scale"]} {regression["stage"]}: {regression["baseline_mean_ms"]:.3f} ms -> {regression["mean_ms"]:.3f} ms')
+        exit_code = 1 if report["regressions"] else 0
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f'Saved benchmark report to {args.output}')
+    sys.exit(exit_code)
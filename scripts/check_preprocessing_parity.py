@@ -0,0 +1,91 @@
+# Import general libraries
+import sys
+import json
+import argparse
+import numpy as np
+from pathlib import Path
+
+# Import image preprocessing
+from routers.line_bot.image_preprocessing import INPUT_SIZE, preprocess_vgg19, preprocess_inception_v3
+
+
+# Keras outputs of every pixel value, i.e. of uint8 0 to 255, recorded with --record. To regenerate them against the pinned TensorFlow:
+#     pip install -r requirements-dev.txt
+#     python -m scripts.check_preprocessing_parity --record
+# which runs keras_expected(), i.e. on a fixed ramp with no random seed:
+#     pixels = np.repeat(np.arange(256, dtype=np.float32)[np.newaxis, :, np.newaxis], 3, axis=2)
+#     {"vgg19": tensorflow.keras.applications.vgg19.preprocess_input(pixels.copy())[0].T.tolist(),
+#      "inception_v3": tensorflow.keras.applications.inception_v3.preprocess_input(pixels.copy())[0, :, 0].tolist()}
+EXPECTED_PATH = Path(__file__).with_name("preprocessing_parity_expected.json")
+
+# Offset of the values of each input channel, so swapped channels get different values
+CHANNEL_OFFSETS = np.array([0, 85, 170])
+
+
+def ramp_image() -> np.ndarray:
+    """Get an RGB input image in which every channel takes every value from 0 to 255."""
+
+    values = np.arange(INPUT_SIZE[0] * INPUT_SIZE[1]).reshape(INPUT_SIZE)
+    return ((values[..., np.newaxis] + CHANNEL_OFFSETS) % 256).astype(np.uint8)[np.newaxis]
+
+
+def keras_expected() -> dict:
+    """Get the Keras output of every pixel value, as a value per output channel and input value."""
+
+    try:
+        from tensorflow.keras.applications.vgg19 import preprocess_input as preprocess_input_vgg19
+        from tensorflow.keras.applications.inception_v3 import preprocess_input as preprocess_input_inception_v3
+    except ImportError:
+        print('Recording the expected values needs Keras. Install the development requirements, i.e. "pip install -r requirements-dev.txt".')
+        sys.exit(2)
+
+    # One pixel per value, with the value in all three channels, as float32 like img_to_array
+    pixels = np.repeat(np.arange(256, dtype=np.float32)[np.newaxis, :, np.newaxis], 3, axis=2)
+    return {
+        "vgg19": preprocess_input_vgg19(pixels.copy())[0].T.tolist(),
+        "inception_v3": preprocess_input_inception_v3(pixels.copy())[0, :, 0].tolist()
+    }
+
+
+def check(expected: dict) -> list:
+    """Compare the NumPy preprocessing of the ramp image with the expected Keras outputs of its pixel values."""
+
+    failures = []
+    pixels = ramp_image()
+
+    # VGG-19 output channel k is BGR, i.e. made from input channel 2 - k
+    vgg19_table = np.asarray(expected["vgg19"], dtype=np.float32)
+    vgg19_expected = np.stack([vgg19_table[channel][pixels[..., 2 - channel]] for channel in range(3)], axis=-1)
+    inception_v3_expected = np.asarray(expected["inception_v3"], dtype=np.float32)[pixels]
+
+    for model_name, result, model_expected in (("vgg19", preprocess_vgg19(pixels), vgg19_expected),
+                                               ("inception_v3", preprocess_inception_v3(pixels), inception_v3_expected)):
+        if result.dtype != model_expected.dtype or result.shape != model_expected.shape:
+            failures.append(f'{model_name} input is {result.dtype}{result.shape}, expected {model_expected.dtype}{model_expected.shape}')
+        elif not np.array_equal(result, model_expected):
+            different = result != model_expected
+            failures.append(f'{model_name} input differs from Keras in {int(different.sum())} values, '
+                            f'max difference {float(np.abs(result.astype(np.float64) - model_expected.astype(np.float64)).max())}')
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the NumPy preprocessing of the recognition models is bit-identical to the Keras preprocessing. "
+                                                 "The preprocessing maps each pixel value on its own, so comparing every value from 0 to 255 "
+                                                 "of every channel with the recorded Keras outputs covers all inputs. No TensorFlow is needed.")
+    parser.add_argument("--record", action="store_true", help="Record the expected values from Keras instead, which needs TensorFlow.")
+    args = parser.parse_args()
+
+    if args.record:
+        with open(EXPECTED_PATH, "w") as f:
+            json.dump(keras_expected(), f)
+        print(f'Keras outputs written to "{EXPECTED_PATH}".')
+        sys.exit(0)
+
+    with open(EXPECTED_PATH) as f:
+        failures = check(json.load(f))
+
+    for failure in failures:
+        print(failure)
+    print(f'Every pixel value of every channel of both model inputs: {len(failures)} inputs differ from Keras.')
+    sys.exit(1 if failures else 0)
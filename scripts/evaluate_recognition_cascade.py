@@ -0,0 +1,151 @@
+# Import general libraries
+import sys
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+from pathlib import Path
+
+# Import recognition
+from routers.line_bot.image_preprocessing import PreparedImage
+from routers.line_bot.food_recognition import FoodRecognition, menu_confidence, cascade_decision
+
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+NON_FOOD_LABEL = "non_food"
+
+
+def load_labeled_images(image_dir: str) -> list:
+    """Get (path, menu ID or None) of the images of a folder with one sub-folder per menu ID and a non_food sub-folder."""
+
+    images = []
+    for label_dir in sorted(Path(image_dir).iterdir()):
+        if not label_dir.is_dir():
+            continue
+        if label_dir.name == NON_FOOD_LABEL:
+            label = None
+        elif label_dir.name.isdigit():
+            label = int(label_dir.name)
+        else:
+            print(f'Skipping the folder "{label_dir}", which is neither a menu ID nor {NON_FOOD_LABEL}.')
+            continue
+        images.extend((path, label) for path in sorted(label_dir.rglob("*")) if path.suffix.lower() in IMAGE_SUFFIXES)
+    return images
+
+
+def run_models(food_recognition: FoodRecognition, images: list) -> list:
+    """Run both models once on every image and keep their outputs and latencies."""
+
+    records = []
+    for path, label in images:
+        img = PreparedImage.from_bytes(path.read_bytes())
+
+        start = time.perf_counter()
+        is_food = bool(food_recognition.is_food(img))
+        vgg19_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        predictions = food_recognition.menu_predictions(img)
+        inception_v3_seconds = time.perf_counter() - start
+
+        confidence, entropy = menu_confidence(predictions)
+        records.append({
+            "label": label,
+            "gate_is_food": is_food,
+            "menu_id": int(np.argmax(predictions)),
+            "confidence": confidence,
+            "entropy": entropy,
+            "vgg19_seconds": vgg19_seconds,
+            "inception_v3_seconds": inception_v3_seconds
+        })
+    return records
+
+
+def summarize(records: list, outcomes: list) -> dict:
+    """Get the accuracy and latency of (is_food, menu_id, ran_vgg19, ran_inception_v3) outcomes of the records."""
+
+    latencies, correct, food_correct, menu_correct, n_food = [], 0, 0, 0, 0
+    for record, (is_food, menu_id, ran_vgg19, ran_inception_v3) in zip(records, outcomes):
+        latencies.append(ran_vgg19 * record["vgg19_seconds"] + ran_inception_v3 * record["inception_v3_seconds"])
+        food_correct += is_food == (record["label"] is not None)
+        correct += (menu_id if is_food else None) == record["label"]
+        if record["label"] is not None:
+            n_food += 1
+            menu_correct += is_food and menu_id == record["label"]
+
+    return {
+        "accuracy": correct / len(records),
+        "food_accuracy": food_correct / len(records),
+        "menu_accuracy": menu_correct / n_food if n_food else 0.0,
+        "vgg19_rate": float(np.mean([outcome[2] for outcome in outcomes])),
+        "mean_latency_ms": 1000 * float(np.mean(latencies)),
+        "p95_latency_ms": 1000 * float(np.percentile(latencies, 95))
+    }
+
+
+def evaluate(records: list, accept_confidences: list, accept_entropies: list, reject_confidences: list) -> list:
+    """Evaluate the gate mode and the cascade mode for every combination of thresholds."""
+
+    gate_outcomes = [(record["gate_is_food"], record["menu_id"], True, record["gate_is_food"]) for record in records]
+    results = [{"mode": "gate", **summarize(records, gate_outcomes)}]
+
+    for accept_confidence, accept_entropy, reject_confidence in itertools.product(accept_confidences, accept_entropies, reject_confidences):
+        if reject_confidence > accept_confidence:
+            continue
+
+        outcomes = []
+        for record in records:
+            decision = cascade_decision(record["confidence"], record["entropy"], accept_confidence, accept_entropy, reject_confidence)
+            is_food = record["gate_is_food"] if decision == "ambiguous" else decision == "accept"
+            outcomes.append((is_food, record["menu_id"], decision == "ambiguous", True))
+
+        results.append({
+            "mode": "cascade",
+            "accept_confidence": accept_confidence,
+            "accept_entropy": accept_entropy,
+            "reject_confidence": reject_confidence,
+            **summarize(records, outcomes)
+        })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the accuracy and latency of the gate and cascade recognition modes on a labeled image folder.")
+    parser.add_argument("image_dir", help="Folder with one sub-folder of photos per menu ID and a non_food sub-folder.")
+    parser.add_argument("--vgg19-model-path", default=FoodRecognition.vgg19_model_path, help="VGG-19 food/non-food model.")
+    parser.add_argument("--inception-v3-model-path", default=FoodRecognition.inception_v3_model_path, help="InceptionV3 menu model.")
+    parser.add_argument("--accept-confidences", type=float, nargs="+", default=[0.7, 0.8, 0.85, 0.9, 0.95], help="Top-1 probabilities at or above which the menu is accepted.")
+    parser.add_argument("--accept-entropies", type=float, nargs="+", default=[0.2, 0.35, 0.5, 1.0], help="Normalized entropies at or below which the menu is accepted.")
+    parser.add_argument("--reject-confidences", type=float, nargs="+", default=[0.0, 0.1, 0.2, 0.3, 0.4], help="Top-1 probabilities below which the image is rejected as not food.")
+    parser.add_argument("--output", default=None, help="JSON file to write the results to.")
+    args = parser.parse_args()
+
+    images = load_labeled_images(args.image_dir)
+    if not images:
+        print(f'No labeled images in "{args.image_dir}".')
+        sys.exit(1)
+
+    # Run each model once per image without batching, so the latencies are those of single images
+    food_recognition = FoodRecognition(max_batch_size=1)
+    food_recognition.vgg19_model_path = args.vgg19_model_path
+    food_recognition.inception_v3_model_path = args.inception_v3_model_path
+    food_recognition.load()
+
+    records = run_models(food_recognition, images)
+    results = evaluate(records, args.accept_confidences, args.accept_entropies, args.reject_confidences)
+
+    # Gate mode first, then the cascade thresholds from the most to the least accurate
+    results = results[:1] + sorted(results[1:], key=lambda result: (-result["accuracy"], result["mean_latency_ms"]))
+    print(f'{len(records)} images, {sum(record["label"] is None for record in records)} of them not food.')
+    print(f'{"mode":<8} {"accept":>6} {"entropy":>7} {"reject":>6} {"acc":>6} {"food":>6} {"menu":>6} {"vgg19":>6} {"mean ms":>8} {"p95 ms":>8}')
+    for result in results:
+        thresholds = (f'{result["accept_confidence"]:>6.2f} {result["accept_entropy"]:>7.2f} {result["reject_confidence"]:>6.2f}'
+                      if result["mode"] == "cascade" else f'{"":>6} {"":>7} {"":>6}')
+        print(f'{result["mode"]:<8} {thresholds} {result["accuracy"]:>6.3f} {result["food_accuracy"]:>6.3f} {result["menu_accuracy"]:>6.3f} '
+              f'{result["vgg19_rate"]:>6.2f} {result["mean_latency_ms"]:>8.2f} {result["p95_latency_ms"]:>8.2f}')
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f'Results written to "{args.output}".')
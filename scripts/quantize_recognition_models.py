@@ -0,0 +1,179 @@
+# Import general libraries
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+
+# Import Onnx and its quantization, which are only needed to make the model variants, not to serve them, see requirements-dev.txt
+import onnx
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+# Import recognition
+from routers.line_bot.image_preprocessing import PreparedImage
+from routers.line_bot.food_recognition import FoodRecognition, FOOD_THRESHOLD
+from routers.line_bot.onnx_sessions import OnnxSessionManager, variant_model_path
+
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+# Input tensor of each recognition model made from a prepared image
+MODEL_INPUTS = {
+    "vgg19": PreparedImage.vgg19_input,
+    "inception_v3": PreparedImage.inception_v3_input
+}
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """Calibration data of static quantization, i.e. the input tensors of a folder of photos, one at a time."""
+
+    def __init__(self, input_name: str, input_arrays: list):
+        self.input_name = input_name
+        self.input_arrays = input_arrays
+        self.position = 0
+
+    def get_next(self):
+        if self.position >= len(self.input_arrays):
+            return None
+        self.position += 1
+        return {self.input_name: self.input_arrays[self.position - 1]}
+
+    def rewind(self):
+        self.position = 0
+
+
+class ModelQuantizer:
+    """Make INT8 and FP16 variants of a recognition model and compare them with the FP32 model.
+
+    The variants are written next to the FP32 model under the paths of variant_model_path, which is
+    where FoodRecognition looks for the precision set by RECOGNITION_VGG19_PRECISION and
+    RECOGNITION_INCEPTION_V3_PRECISION.
+    """
+
+    def __init__(self, model_name: str, model_path: str, calibration_dir: str, eval_dir: str = None, max_images: int = 200):
+        """Initialize the model quantizer.
+
+        Args:
+            model_name (str): "vgg19" or "inception_v3", which selects the preprocessing of the model.
+            model_path (str): Path of the FP32 Onnx model.
+            calibration_dir (str): Folder of representative photos, searched recursively.
+            eval_dir (str): Folder of the photos the variants are compared on. Defaults to the calibration photos.
+            max_images (int): Largest number of photos used.
+        """
+
+        if model_name not in MODEL_INPUTS:
+            raise ValueError(f'Invalid model name: {model_name}')
+        self.model_name = model_name
+        self.model_path = model_path
+        self.input_arrays = self.load_input_arrays(calibration_dir, max_images)
+        self.eval_arrays = self.load_input_arrays(eval_dir, max_images) if eval_dir else self.input_arrays
+        self.session_manager = OnnxSessionManager()
+
+    def load_input_arrays(self, image_dir: str, max_images: int) -> list:
+        paths = sorted(path for path in Path(image_dir).rglob("*") if path.suffix.lower() in IMAGE_SUFFIXES)[:max_images]
+        if not paths:
+            raise ValueError(f'No images in "{image_dir}"')
+        return [MODEL_INPUTS[self.model_name](PreparedImage.from_bytes(path.read_bytes())) for path in paths]
+
+    def quantize(self, precision: str) -> str:
+        """Make the variant of a precision and get its path."""
+
+        output_path = variant_model_path(self.model_path, precision)
+        if precision == "int8-dynamic":
+            # Weights are INT8 and activations are quantized on the fly
+            quantize_dynamic(self.model_path, output_path, weight_type=QuantType.QInt8)
+        elif precision == "int8-static":
+            # Weights and activations are INT8, with activation ranges calibrated on the photos
+            input_name = self.session_manager.get(self.model_path).input_name
+            quantize_static(self.model_path, output_path, ImageCalibrationReader(input_name, self.input_arrays), quant_format=QuantFormat.QDQ,
+                            per_channel=True, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+        elif precision == "fp16":
+            # Weights and activations are FP16 while the input and output stay FP32, so the preprocessing is unchanged
+            from onnxconverter_common import float16
+            onnx.save(float16.convert_float_to_float16(onnx.load(self.model_path), keep_io_types=True), output_path)
+        else:
+            raise ValueError(f'Invalid quantized precision: {precision}')
+        return output_path
+
+    def top1(self, predictions: np.ndarray) -> np.ndarray:
+        """Get the decisions FoodRecognition makes from the outputs, i.e. the food bit of VGG-19 and the menu of InceptionV3."""
+
+        predictions = predictions.reshape(len(predictions), -1)
+        if predictions.shape[1] == 1:
+            return predictions[:, 0] >= FOOD_THRESHOLD
+        return np.argmax(predictions, axis=1)
+
+    def measure(self, model_path: str) -> tuple:
+        """Get the top-1 decisions and the single-image latencies in seconds of a model over the photos."""
+
+        model = self.session_manager.get(model_path)
+        model.warm_up()
+
+        decisions, latencies = [], []
+        for input_array in self.eval_arrays:
+            start = time.perf_counter()
+            predictions = model.run(input_array)
+            latencies.append(time.perf_counter() - start)
+            decisions.append(self.top1(predictions)[0])
+        return np.asarray(decisions), np.asarray(latencies)
+
+    def report(self, precisions: list) -> list:
+        """Compare the top-1 decisions, latency and size of the variants with the FP32 model."""
+
+        reference_decisions, reference_latencies = self.measure(self.model_path)
+        results = []
+        for precision in ["fp32"] + [precision for precision in precisions if precision != "fp32"]:
+            model_path = variant_model_path(self.model_path, precision)
+            if not os.path.exists(model_path):
+                print(f'Skipping the {precision} model "{model_path}", which does not exist.')
+                continue
+
+            decisions, latencies = (reference_decisions, reference_latencies) if precision == "fp32" else self.measure(model_path)
+            results.append({
+                "model": self.model_name,
+                "precision": precision,
+                "path": model_path,
+                "size_mb": os.path.getsize(model_path) / 2**20,
+                "top1_agreement": float(np.mean(decisions == reference_decisions)),
+                "mean_latency_ms": 1000 * float(np.mean(latencies)),
+                "p95_latency_ms": 1000 * float(np.percentile(latencies, 95)),
+                "speedup": float(np.mean(reference_latencies) / np.mean(latencies))
+            })
+        return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Make INT8 and FP16 variants of the food recognition models and report their agreement with FP32 and latency.")
+    parser.add_argument("calibration_dir", help="Folder of representative photos used to calibrate static quantization.")
+    parser.add_argument("--eval-dir", default=None, help="Folder of the photos the report compares the variants on. Defaults to the calibration photos.")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_INPUTS), choices=list(MODEL_INPUTS), help="Models to quantize.")
+    parser.add_argument("--precisions", nargs="+", default=["int8-dynamic", "int8-static"], choices=["int8-dynamic", "int8-static", "fp16"], help="Variants to make. fp16 needs onnxconverter-common.")
+    parser.add_argument("--vgg19-model-path", default=FoodRecognition.vgg19_model_path, help="FP32 VGG-19 model.")
+    parser.add_argument("--inception-v3-model-path", default=FoodRecognition.inception_v3_model_path, help="FP32 InceptionV3 model.")
+    parser.add_argument("--max-images", type=int, default=200, help="Largest number of photos used.")
+    parser.add_argument("--report-only", action="store_true", help="Only report on the existing variants.")
+    parser.add_argument("--output", default=None, help="JSON file to write the report to.")
+    args = parser.parse_args()
+
+    model_paths = {"vgg19": args.vgg19_model_path, "inception_v3": args.inception_v3_model_path}
+    results = []
+    for model_name in args.models:
+        quantizer = ModelQuantizer(model_name, model_paths[model_name], args.calibration_dir, eval_dir=args.eval_dir, max_images=args.max_images)
+        if not args.report_only:
+            for precision in args.precisions:
+                start = time.perf_counter()
+                print(f'Saved the {precision} {model_name} model to "{quantizer.quantize(precision)}" in {time.perf_counter() - start:.1f} s.')
+        results.extend(quantizer.report(args.precisions))
+
+    print(f'{"model":<13} {"precision":<13} {"size MB":>8} {"top-1 agr.":>10} {"mean ms":>8} {"p95 ms":>8} {"speedup":>8}')
+    for result in results:
+        print(f'{result["model"]:<13} {result["precision"]:<13} {result["size_mb"]:>8.1f} {result["top1_agreement"]:>10.3f} '
+              f'{result["mean_latency_ms"]:>8.2f} {result["p95_latency_ms"]:>8.2f} {result["speedup"]:>7.2f}x')
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f'Report written to "{args.output}".')
+    sys.exit(0 if results else 1)
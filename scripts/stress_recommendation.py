@@ -0,0 +1,100 @@
+# Import general libraries
+import sys
+import copy
+import random
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Import LightFM and other libraries for recommendation
+from lightfm import LightFM
+
+# Import recommendation
+from routers.line_bot.menu_catalog import NUTRIENTS, MEAL_TIMES
+from routers.line_bot.similarity_store import SimilarityStore
+from routers.line_bot.food_recommendation import FoodRecommendation
+
+
+def make_cases(n_users: int, n_menus: int, n_cases: int, seed: int) -> list:
+    """Make recommendation requests with random users, previous menus, goals and meal times."""
+
+    rng = random.Random(seed)
+    return [{
+        "user_id": rng.randrange(n_users),
+        "food_id": rng.randrange(-1, n_menus),
+        "nutritional_goal_left": {nutrient: rng.uniform(0, 1000) for nutrient in NUTRIENTS},
+        "meal_time": rng.choice(MEAL_TIMES)
+    } for _ in range(n_cases)]
+
+
+def to_plain(top_n_food_data) -> list:
+    return [(food_name, dict(food_data)) for food_name, food_data in top_n_food_data.items()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run many threads against one FoodRecommendation instance and check the results are deterministic and read-only. "
+                                                 "Exits with status 1 on any failure, so it can run as a check.")
+    parser.add_argument("--threads", type=int, default=32, help="Number of threads.")
+    parser.add_argument("--cases", type=int, default=200, help="Number of distinct recommendation requests.")
+    parser.add_argument("--rounds", type=int, default=20, help="Number of times each request is repeated concurrently.")
+    parser.add_argument("--model-path", default=None, help="Pickled model to use. Defaults to a model fitted on the mock data.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the requests.")
+    args = parser.parse_args()
+
+    food_recommendation = FoodRecommendation()
+    food_recommendation.similarity_store = SimilarityStore(cache_dir=tempfile.mkdtemp())
+
+    # Mock data of the food dataset and the poll, where food IDs are rows of the food dataset
+    user_features = food_recommendation.get_user_features()
+    food_features = food_recommendation.get_food_features()
+    nutrient_data = food_recommendation.df_food_feature.set_index('Nutrient')[MEAL_TIMES + NUTRIENTS].to_dict('index')
+    food_names = list(nutrient_data)
+    nutrient_data_before = copy.deepcopy(nutrient_data)
+
+    if args.model_path:
+        model = food_recommendation.load_model(args.model_path)
+    else:
+        model = LightFM(loss='warp', no_components=32, random_state=args.seed)
+        model.fit(food_recommendation.get_interaction_matrix(), user_features=user_features, item_features=food_features, epochs=10)
+
+    def recommend(case):
+        return food_recommendation.dynamic_food_recommend(model, None, case["user_id"], user_features, case["food_id"], food_names, food_features,
+                                                          nutrient_data, case["nutritional_goal_left"], case["meal_time"])
+
+    cases = make_cases(user_features.shape[0], len(food_names), args.cases, args.seed)
+    failures = []
+
+    # Expected results of a single thread
+    expected = [to_plain(recommend(case)) for case in cases]
+
+    # The same requests in shuffled order from many threads, together with feature rebuilds
+    tasks = [index for index in range(len(cases)) for _ in range(args.rounds)]
+    random.Random(args.seed).shuffle(tasks)
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        results = list(executor.map(lambda index: (index, recommend(cases[index])), tasks))
+        user_features_results = list(executor.map(lambda _: food_recommendation.get_user_features(), range(args.threads)))
+
+    for index, result in results:
+        if to_plain(result) != expected[index]:
+            failures.append(f'Request {index} gave {to_plain(result)}, expected {expected[index]}')
+
+    for result in user_features_results:
+        if (result != user_features).nnz:
+            failures.append('get_user_features gave a different matrix on a repeated call')
+
+    if nutrient_data != nutrient_data_before:
+        failures.append('The shared nutrient data was modified')
+
+    # Results are read-only
+    food_name = next(iter(results[0][1]), None)
+    for modify in (lambda result: result.pop(food_name), lambda result: result[food_name].__setitem__('score', 0)):
+        try:
+            modify(results[0][1])
+            failures.append('A recommendation result could be modified')
+        except (TypeError, AttributeError):
+            pass
+
+    for failure in failures[:20]:
+        print(failure)
+    print(f'{len(results)} concurrent recommendations on {args.threads} threads: {len(failures)} failures.')
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,32 @@
+class Signal:
+    """Minimal publish/subscribe hook used to notify in-memory recommendation state of database changes."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._receivers = []
+
+    def connect(self, receiver):
+        """Register a receiver that is called with the keyword arguments of every send()."""
+        if receiver not in self._receivers:
+            self._receivers.append(receiver)
+        return receiver
+
+    def disconnect(self, receiver):
+        if receiver in self._receivers:
+            self._receivers.remove(receiver)
+
+    def send(self, **kwargs):
+        """Call every receiver. The database change is already committed, so a failing receiver must not fail the caller."""
+        for receiver in list(self._receivers):
+            try:
+                receiver(**kwargs)
+            except Exception as e:
+                print(f'Receiver of signal "{self.name}" failed: {e}')
+
+
+# Database change signals
+menu_changed = Signal("menu_changed")
+menu_feature_changed = Signal("menu_feature_changed")
+user_created = Signal("user_created")
+user_features_created = Signal("user_features_created")
+order_created = Signal("order_created")